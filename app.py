@@ -56,19 +56,18 @@ FLASK_OUTPUT_BASE_DIR = Path(config.get('General', 'base_output_dir', fallback=s
 FLASK_OUTPUT_BASE_DIR.mkdir(parents=True, exist_ok=True)
 
 # --- 3. 初始化 Flask 扩展 ---
-from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
-from flask_login import LoginManager, current_user, login_user, logout_user, login_required
-
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
-login_manager = LoginManager(app)
-login_manager.login_view = 'login'
-login_manager.login_message = '请先登录以访问此页面。'
-login_manager.login_message_category = 'info'
-
-# --- 4. 模型导入 (在 db 初始化之后) ---
-from models import User, TaskRecord
+from flask_login import current_user, login_user, logout_user, login_required
+from extensions import db, migrate, login_manager # 扩展实例定义在 extensions.py 中
+
+db.init_app(app)
+migrate.init_app(app, db)
+login_manager.init_app(app)
+
+# --- 4. 模型导入 ---
+from models import User, TaskRecord, load_video_limits, ensure_task_record_indexes
+load_video_limits(config) # 角色视频上限只解析一次
+with app.app_context():
+    ensure_task_record_indexes(app.logger) # 旧数据库中补建 (user_id, created_at) 复合索引
 
 # --- 5. Flask-Login user_loader 回调函数 ---
 @login_manager.user_loader
@@ -30,6 +30,17 @@ def create_celery_app(flask_app_instance): # 参数名明确表示是 Flask app
 
     # 将 Flask app 的配置更新到 Celery 的配置中
     celery_instance.conf.update(flask_app_instance.config)
+
+    # worker 进程会缓存 Whisper 模型等大对象，每个子进程处理一定数量的任务后重启以回收内存
+    max_tasks_per_child = 50
+    # 转换任务一次要运行数分钟：每个执行单元只预取 1 个任务，排队的任务交给真正空闲的 worker，
+    # 而不是积压在某个忙碌 worker 的预留队列里 (任务本身已设置 acks_late，预取数即实际占用数)
+    prefetch_multiplier = 1
+    if app_config_parser:
+        max_tasks_per_child = app_config_parser.getint('Celery', 'worker_max_tasks_per_child', fallback=50)
+        prefetch_multiplier = app_config_parser.getint('Celery', 'worker_prefetch_multiplier', fallback=1)
+    celery_instance.conf.worker_max_tasks_per_child = max_tasks_per_child
+    celery_instance.conf.worker_prefetch_multiplier = prefetch_multiplier
     
     if app_config_parser:
         celery_instance.conf.APP_CONFIG = app_config_parser # 存储原始 configparser 对象
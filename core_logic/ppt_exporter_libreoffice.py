@@ -10,7 +10,7 @@ import configparser
 import shlex # 确保导入 shlex
 
 # 导入共享工具函数
-from .utils import get_tool_path, get_poppler_path
+from .utils import get_tool_path, get_poppler_path, LazyShellJoin
 
 # 导入 pdf2image
 try:
@@ -122,7 +122,7 @@ def export_slides_with_libreoffice(
                 "--outdir", str(temp_pdf_dir.resolve()),
                 str(pptx_filepath.resolve())
             ]
-            logger.debug(f"执行 LibreOffice 命令: {shlex.join(cmd_convert_to_pdf)}")
+            logger.debug("执行 LibreOffice 命令: %s", LazyShellJoin(cmd_convert_to_pdf))
             task_instance.update_state('PROCESSING', meta={'stage': STAGE_PPT_IMAGES, 'progress': 10, 'status': 'Running LibreOffice conversion'})
             try:
                 timeout_seconds = config.getint('General', 'libreoffice_timeout', fallback=180)
@@ -25,7 +25,7 @@ except ImportError:
 # 导入同级模块使用相对路径
 from .tts_manager_edge import generate_audio_segment # 导入 tts 管理器
 from .ppt_exporter_libreoffice import export_slides_with_libreoffice # 只导入 LibreOffice 导出器
-from .utils import get_audio_duration, get_tool_path # 从 utils 导入工具函数
+from .utils import get_tool_path, write_duration_sidecar # 从 utils 导入工具函数
 
 
 # 导入 Presentation 类
@@ -128,6 +128,9 @@ def generate_audio_segments(
     tts_retries = config.getint('Audio', 'tts_retries', fallback=1)
     tts_retry_delay = config.getfloat('Audio', 'tts_retry_delay', fallback=1.5)
     num_segments = len(notes)
+    # 同一次转换中 voice_id/rate 固定，重复的备注文本（标题页、"谢谢大家" 等）只合成一次，
+    # 之后的片段直接硬链接（或复制）第一次生成的文件并复用其时长
+    synthesized: dict[str, tuple[Path, float]] = {}
 
     for i, text in enumerate(notes):
         segment_num = i + 1
@@ -141,36 +144,47 @@ def generate_audio_segments(
         task_instance.update_state('PROCESSING', meta={'stage': STAGE_GENERATE_AUDIO, 'progress': progress, 'current_segment': segment_num, 'status': f'Generating audio {segment_num}/{num_segments}'})
 
 
+        if text in synthesized:
+            first_path, duration_sec = synthesized[text]
+            try:
+                try:
+                    os.link(first_path, audio_filepath)
+                except OSError: # 不支持硬链接（跨设备/文件系统限制）时退回复制
+                    shutil.copyfile(first_path, audio_filepath)
+                audio_path_str = os.path.abspath(audio_filepath)
+                write_duration_sidecar(audio_filepath, duration_sec, logger)
+                logger.debug(f"  片段 {segment_num} 文本与之前的片段相同，复用音频 {first_path.name}")
+                audio_results.append((audio_path_str, duration_sec))
+                continue
+            except OSError as e:
+                logger.warning(f"  复用片段 {segment_num} 的重复音频失败，将重新合成: {e}")
+                duration_sec = 0.0
+
         if text and not text.isspace():
             logger.debug(f"  生成片段 {segment_num} 的音频 (文本: '{text[:50]}...')...")
 
-            # 调用 tts_manager 中的函数
-            success = generate_audio_segment( # generate_audio_segment 内部会处理重试和异常
+            # 调用 tts_manager 中的函数，成功时直接返回合成数据流中得到的时长，无需再探测文件
+            duration_sec_raw = generate_audio_segment( # generate_audio_segment 内部会处理重试和异常
                 voice_id,
                 text,
                 audio_filepath,
                 rate=rate,
                 logger=logger,
                 max_retries=tts_retries,
-                retry_delay=tts_retry_delay
+                retry_delay=tts_retry_delay,
+                config=config
             )
 
-            if success:
-                duration_sec_raw = get_audio_duration(audio_filepath, logger, config)
-                if duration_sec_raw is not None and duration_sec_raw > 0.01:
+            if duration_sec_raw is not None:
+                audio_path_str = os.path.abspath(audio_filepath)
+                if duration_sec_raw > 0.01:
                     duration_sec = duration_sec_raw
-                    audio_path_str = str(audio_filepath.resolve())
+                    synthesized[text] = (audio_filepath, duration_sec)
                     logger.debug(f"    片段 {segment_num} 生成成功, 时长: {duration_sec:.3f}s")
-                elif duration_sec_raw is not None:
-                     audio_path_str = str(audio_filepath.resolve())
+                else:
                      logger.warning(f"    片段 {segment_num} 音频时长无效或过短 ({duration_sec_raw:.3f}s)，时长记为 0。")
                      duration_sec = 0.0
-                else: # 获取时长失败
-                     # get_audio_duration 内部会记录错误
-                     audio_path_str = str(audio_filepath.resolve()) # 文件可能存在
-                     duration_sec = 0.0 # 时长记为 0
-                     logger.error(f"    无法获取片段 {segment_num} ({audio_filepath.name}) 的有效时长！时长记为 0。")
-            else: # TTS 生成失败 (generate_audio_segment 返回 False)
+            else: # TTS 生成失败 (generate_audio_segment 返回 None)
                 duration_sec = 0.0 # 时长记为 0
                 logger.error(f"    片段 {segment_num} TTS 生成失败。")
         else:
@@ -0,0 +1,213 @@
+# core_logic/tts_cache.py
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+import contextlib
+from pathlib import Path
+
+try:
+    import fcntl # POSIX 文件锁，保护多个 worker 进程对清单的读-改-写
+except ImportError: # Windows
+    fcntl = None
+
+# --- Edge TTS 音频磁盘缓存 ---
+# 以 sha256(voice_id | rate_str | text) 为键，把合成好的 MP3 保存在配置的缓存目录中。
+# 同一份演讲稿再次转换（或同一稿件中重复出现的句子）时直接复制/硬链接缓存文件，跳过网络合成。
+# 目录结构:
+#   <cache_dir>/<key>.mp3
+#   <cache_dir>/manifest.json   -> {key: {"path", "size", "mtime", "duration"}}
+#   <cache_dir>/manifest.lock   -> 清单的进程间文件锁
+# 清单中的 mtime 记录最近一次使用时间，超出容量上限时按它做 LRU 淘汰。
+# 缓存文件会被硬链接到各任务目录，因此不能修改缓存文件本身 (包括 os.utime)：
+# 同一 inode 上的任务副本会一起变化。
+
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = "manifest.lock"
+_MANIFEST_LOCK = threading.Lock() # 同一进程内的并发保护；进程之间使用 LOCK_NAME 文件锁
+
+
+def cache_key(voice_id: str, rate_str: str, text: str) -> str:
+    """根据语音、语速和文本计算缓存键。"""
+    return hashlib.sha256(f"{voice_id}|{rate_str}|{text}".encode("utf-8")).hexdigest()
+
+
+def _load_manifest(cache_dir: Path) -> dict:
+    try:
+        with open(cache_dir / MANIFEST_NAME, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        return manifest if isinstance(manifest, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+@contextlib.contextmanager
+def _manifest_locked(cache_dir: Path):
+    """在清单的读-改-写期间持有进程内锁和 (POSIX 下的) 进程间文件锁。"""
+    with _MANIFEST_LOCK:
+        if fcntl is None:
+            yield
+            return
+        with open(cache_dir / LOCK_NAME, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _save_manifest(cache_dir: Path, manifest: dict):
+    # 先写临时文件再原子替换，避免多个 worker 同时写入时读到半截 JSON
+    tmp_path = cache_dir / f"{MANIFEST_NAME}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, cache_dir / MANIFEST_NAME)
+
+
+def _link_or_copy(src: Path, dst: Path):
+    """同一文件系统上用硬链接（零拷贝），否则退回普通复制。"""
+    dst.unlink(missing_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def get(cache_dir: Path, key: str) -> Path | None:
+    """
+    查询缓存。命中时返回缓存文件路径，未命中返回 None。
+    """
+    entry_path = cache_dir / f"{key}.mp3"
+    try:
+        if entry_path.stat().st_size <= 100:
+            return None
+    except OSError:
+        return None
+    return entry_path
+
+
+def _touch(cache_dir: Path, key: str, entry_path: Path):
+    """在清单中刷新条目的最近使用时间 (用于 LRU)。"""
+    with _manifest_locked(cache_dir):
+        manifest = _load_manifest(cache_dir)
+        entry = manifest.get(key) or {"path": entry_path.name, "size": entry_path.stat().st_size, "duration": None}
+        entry["mtime"] = time.time()
+        manifest[key] = entry
+        _save_manifest(cache_dir, manifest)
+
+
+def get_duration(cache_dir: Path, key: str) -> float | None:
+    """返回清单中记录的音频时长（秒），没有记录时返回 None。"""
+    with _MANIFEST_LOCK:
+        entry = _load_manifest(cache_dir).get(key)
+    if entry and entry.get("duration") is not None:
+        try:
+            return float(entry["duration"])
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def fetch(cache_dir: Path, key: str, output_path: Path) -> bool:
+    """
+    命中缓存时把缓存文件放到 output_path（优先硬链接），返回是否命中。
+    """
+    entry_path = get(cache_dir, key)
+    if entry_path is None:
+        return False
+    try:
+        _link_or_copy(entry_path, output_path)
+    except OSError:
+        return False
+    try:
+        _touch(cache_dir, key, entry_path)
+    except OSError:
+        pass # 只影响淘汰顺序，不影响本次命中
+    return True
+
+
+def discard(cache_dir: Path, key: str):
+    """删除一个缓存条目 (例如内容损坏、无法读取时长)。已链接到任务目录的副本不受影响。"""
+    try:
+        (cache_dir / f"{key}.mp3").unlink(missing_ok=True)
+        with _manifest_locked(cache_dir):
+            manifest = _load_manifest(cache_dir)
+            if manifest.pop(key, None) is not None:
+                _save_manifest(cache_dir, manifest)
+    except OSError:
+        pass
+
+
+def put(
+    cache_dir: Path,
+    key: str,
+    src_path: Path,
+    max_bytes: int,
+    logger: logging.Logger,
+    duration: float | None = None
+) -> bool:
+    """
+    把已合成的音频文件加入缓存，并在超出 max_bytes 时按 LRU 淘汰旧条目。
+
+    Args:
+        cache_dir: 缓存目录。
+        key: cache_key() 计算出的缓存键。
+        src_path: 已生成的音频文件路径。
+        max_bytes: 缓存容量上限（字节）。
+        logger: 日志记录器实例。
+        duration: (可选) 音频时长，记录在清单中。
+
+    Returns:
+        成功写入缓存返回 True，否则返回 False（缓存失败不影响主流程）。
+    """
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        entry_path = cache_dir / f"{key}.mp3"
+        _link_or_copy(src_path, entry_path)
+        st = entry_path.stat()
+        with _manifest_locked(cache_dir):
+            manifest = _load_manifest(cache_dir)
+            manifest[key] = {"path": entry_path.name, "size": st.st_size, "mtime": time.time(), "duration": duration}
+            _evict(cache_dir, manifest, max_bytes, logger)
+            _save_manifest(cache_dir, manifest)
+        return True
+    except OSError as e:
+        logger.warning(f"写入 TTS 缓存失败 ({src_path.name}): {e}")
+        return False
+
+
+def _evict(cache_dir: Path, manifest: dict, max_bytes: int, logger: logging.Logger):
+    """
+    按最近使用时间从旧到新删除条目，直到总大小不超过 max_bytes。
+    总大小按缓存目录中的实际文件统计，清单中缺失的条目 (例如旧版本无锁写入时丢失的) 同样会被计入和淘汰。
+    """
+    entries = []
+    total = 0
+    present = set()
+    for entry_path in cache_dir.glob("*.mp3"):
+        key = entry_path.stem
+        try:
+            st = entry_path.stat()
+        except OSError:
+            continue
+        present.add(key)
+        last_used = (manifest.get(key) or {}).get("mtime") or st.st_mtime # 清单中没有记录时退回文件创建时间
+        entries.append((last_used, key, entry_path, st.st_size))
+        total += st.st_size
+    for key in list(manifest):
+        if key not in present:
+            manifest.pop(key, None) # 文件已不存在，清理清单
+
+    if total <= max_bytes:
+        return
+    entries.sort()
+    for _, key, entry_path, size in entries:
+        if total <= max_bytes:
+            break
+        entry_path.unlink(missing_ok=True)
+        manifest.pop(key, None)
+        total -= size
+        logger.debug(f"TTS 缓存淘汰: {entry_path.name}")
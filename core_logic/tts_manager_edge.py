@@ -6,13 +6,22 @@ import tempfile # 用于创建临时文件
 from pathlib import Path # 路径操作
 import os # 操作系统交互
 import time # 时间相关，用于重试延迟
+import random # 重试退避抖动
+import functools # 缓存语速字符串
+import threading # 后台事件循环线程
+import atexit # 进程退出时关闭共享连接器
+import aiohttp # edge-tts 底层使用的 HTTP/WebSocket 客户端
+import configparser # 读取缓存配置
 # 导入 Edge TTS 库可能抛出的异常
 from edge_tts.exceptions import NoAudioReceived, EdgeTTSException
 
 # 导入 utils 模块，获取工具函数
 # 注意：这里的导入使用了相对导入，因为 tts_manager_edge.py 在 core_logic 包内
 try:
-    from .utils import get_audio_duration # 导入获取音频时长函数
+    from .utils import get_audio_duration_fast as get_audio_duration # 导入获取音频时长函数 (MP3 进程内解析)
+    from .utils import write_duration_sidecar # 记录已知时长，后续查询无需再解析文件
+    from .utils import gevent_patched # 判断是否运行在 gevent worker 中
+    from . import tts_cache # 合成结果的磁盘缓存
     # from .utils import get_tool_path # 如果 Edge TTS 依赖外部工具，需要从 utils 导入
 except ImportError as e:
     # 如果 utils 导入失败，记录错误
@@ -51,11 +60,163 @@ KNOWN_EDGE_VOICES = {
     # 可以根据需要添加更多语音ID
 }
 
+# 语音列表在运行期间不会变化，导入时预先生成排序好的列表和语言前缀映射，避免每次请求都复制、排序
+_AVAILABLE_VOICES_SORTED: tuple[dict, ...] = tuple(
+    sorted(({**details, 'id': voice_id} for voice_id, details in KNOWN_EDGE_VOICES.items()),
+           key=lambda x: x.get('name', ''))
+)
+_VOICE_IDS: frozenset[str] = frozenset(KNOWN_EDGE_VOICES)
+_VOICE_LANG_PREFIX: dict[str, str] = {
+    voice_id: details.get('lang', 'en').split('-')[0].lower() for voice_id, details in KNOWN_EDGE_VOICES.items()
+}
+
+# --- 共享事件循环与连接器 ---
+# edge-tts 每次合成都会新建 aiohttp.ClientSession；如果每次调用还各自创建/销毁事件循环，
+# 连接器中的 DNS 缓存也会随之丢弃。这里在一个后台守护线程中运行一个常驻事件循环，
+# 所有合成协程都提交到这个循环上执行，并共用同一个 TCPConnector 和并发信号量。
+# 注意：共享的只有 DNS 缓存。edge-tts 通过 ws_connect 建立 WebSocket，升级后的连接不会归还给
+# aiohttp 的连接池，每个片段仍要重新进行 TCP + TLS 握手。
+# 注意：Celery 默认的 prefork 进程池会 fork 子进程，线程不会被继承，
+# 因此按 PID 懒加载，子进程第一次调用时会重新创建自己的循环。
+_LOOP: asyncio.AbstractEventLoop | None = None
+_LOOP_STOP: asyncio.Event | None = None # 设置后后台线程中的 asyncio.run() 退出并清理循环
+_LOOP_PID: int | None = None
+_LOOP_LOCK = threading.Lock()
+_CONNECTOR: "_SharedTCPConnector | None" = None
+# 同时进行的 Edge TTS 连接数上限。并发过高会被微软服务端限流甚至封禁，
+# 可通过环境变量 EDGE_TTS_CONCURRENCY 调整（默认 6）。
+EDGE_TTS_CONCURRENCY = max(1, int(os.getenv("EDGE_TTS_CONCURRENCY", "6")))
+_EDGE_SEM: asyncio.Semaphore | None = None
+
+
+class _SharedTCPConnector(aiohttp.TCPConnector):
+    """
+    可在多个 ClientSession 之间共享的连接器。
+
+    edge-tts 内部以 `async with aiohttp.ClientSession(connector=...)` 的方式使用连接器，
+    会话关闭时默认会一并关闭连接器。这里把 close() 变为空操作，
+    真正的关闭由 close_shared() 在进程退出时完成。
+    """
+
+    async def close(self, *args, **kwargs):
+        return None
+
+    async def close_shared(self):
+        await super().close()
+
+
+_gevent_patched = gevent_patched # 判断逻辑与文件操作共用 utils 中的实现
+
+
+def _loop_thread_main(ready, holder: list):
+    """
+    后台线程入口。事件循环的创建、关闭以及异步生成器/默认执行器的清理都交给 asyncio.run()，
+    不修改全局事件循环策略，也不会遗留未关闭的循环。
+    """
+    async def _serve():
+        holder.append(asyncio.get_running_loop())
+        holder.append(asyncio.Event())
+        ready()
+        await holder[1].wait()
+
+    asyncio.run(_serve())
+
+
+def _get_shared_loop() -> asyncio.AbstractEventLoop:
+    """获取（必要时创建）当前进程的常驻后台事件循环。"""
+    global _LOOP, _LOOP_STOP, _LOOP_PID, _CONNECTOR, _EDGE_SEM
+    with _LOOP_LOCK:
+        if _LOOP is None or _LOOP_PID != os.getpid() or _LOOP.is_closed():
+            holder = []
+            if _gevent_patched():
+                # gevent 下 threading.Thread 会变成 greenlet，run_forever 会阻塞整个 hub。
+                # 这里用未打补丁的原始线程原语启动真正的系统线程来运行事件循环。
+                from gevent import monkey
+                ready = monkey.get_original("_thread", "allocate_lock")()
+                ready.acquire()
+                monkey.get_original("_thread", "start_new_thread")(_loop_thread_main, (ready.release, holder))
+                ready.acquire()
+            else:
+                ready = threading.Event()
+                thread = threading.Thread(target=_loop_thread_main, args=(ready.set, holder), name="edge-tts-loop", daemon=True)
+                thread.start()
+                ready.wait()
+            _LOOP, _LOOP_STOP = holder
+            _LOOP_PID = os.getpid()
+            _CONNECTOR = None # 连接器绑定在旧循环上，需要在新循环中重新创建
+            _EDGE_SEM = None # 信号量同样绑定事件循环
+        return _LOOP
+
+
+def _get_shared_connector() -> _SharedTCPConnector:
+    """获取共享连接器。只能在共享事件循环中调用。"""
+    global _CONNECTOR
+    if _CONNECTOR is None:
+        _CONNECTOR = _SharedTCPConnector(limit=16, ttl_dns_cache=300) # WebSocket 连接不回池，keepalive 无意义
+    return _CONNECTOR
+
+
+def _get_edge_semaphore() -> asyncio.Semaphore:
+    """获取限制并发连接数的信号量。只能在共享事件循环中调用（信号量会绑定到运行中的循环）。"""
+    global _EDGE_SEM
+    if _EDGE_SEM is None:
+        _EDGE_SEM = asyncio.Semaphore(EDGE_TTS_CONCURRENCY)
+    return _EDGE_SEM
+
+
+@atexit.register
+def _shutdown_shared_loop():
+    """进程退出时关闭共享连接器并停止后台事件循环。"""
+    loop = _LOOP
+    if loop is None or _LOOP_PID != os.getpid() or loop.is_closed():
+        return
+    try:
+        if _CONNECTOR is not None:
+            asyncio.run_coroutine_threadsafe(_CONNECTOR.close_shared(), loop).result(timeout=5)
+    except Exception:
+        pass # 退出阶段的清理失败可以忽略
+    if _LOOP_STOP is not None:
+        loop.call_soon_threadsafe(_LOOP_STOP.set)
+
+
 # --- 异步执行帮助函数 (在 Celery Worker 中运行异步代码) ---
-# 警告：在 Celery Worker 的默认进程池 (prefork) 中直接运行 asyncio 事件循环可能会有问题，因为它不是线程安全的。
-# 更好的方式是在 Celery Worker 配置中使用 eventlet 或 gevent 进程池，或者使用专门的异步任务库。
-# 此函数用于在同步代码中（如 Celery Worker 的同步任务）安全地运行异步函数。
-# 它为每个调用创建一个新的事件循环并在其中运行异步函数。
+# 此函数用于在同步代码中（如 Celery Worker 的同步任务）运行异步函数。
+# 协程被提交到上面的常驻后台事件循环中执行，调用线程阻塞等待结果，
+# 因此不会干扰调用线程自身的事件循环或事件循环策略。
+#
+# Worker 进程池的选择：
+# - prefork (默认): 每个子进程各自懒加载一个后台循环，一个进程同一时间只跑一个任务。
+# - gevent (见 run_worker.sh): Edge TTS 基本是纯网络等待，一个进程内可以并发跑很多任务，
+#   它们共享同一个后台循环、DNS 缓存和并发信号量 (EDGE_TTS_CONCURRENCY)。
+#   Celery 的 `-P gevent` 会在导入任务模块之前自动执行 monkey.patch_all()。
+#   此时后台循环运行在真正的系统线程中，等待结果只挂起当前 greenlet，不阻塞 hub。
+#   注意：语音识别 (stable-ts) 等 CPU 密集步骤仍会占住整个进程，gevent 并发数不宜设得过高。
+def _run_in_gevent(coro, loop: asyncio.AbstractEventLoop):
+    """
+    gevent 环境下把协程提交到后台循环，并通过 hub 的 async watcher 等待完成。
+    async watcher 的 send() 可以从其他系统线程安全调用，只挂起当前 greenlet。
+    """
+    import gevent
+    from gevent.event import Event as GeventEvent
+
+    done = GeventEvent()
+    watcher = gevent.get_hub().loop.async_()
+    watcher.start(done.set) # 先启动 watcher，避免协程在等待前就完成而丢失通知
+    holder = []
+
+    def _schedule():
+        task = asyncio.ensure_future(coro)
+        holder.append(task)
+        task.add_done_callback(lambda _: watcher.send())
+
+    try:
+        loop.call_soon_threadsafe(_schedule)
+        done.wait()
+    finally:
+        watcher.close()
+    return holder[0].result()
+
+
 def run_async_in_sync(async_func):
     """
     在同步函数中运行给定的异步函数。
@@ -66,51 +227,27 @@ def run_async_in_sync(async_func):
     Returns:
         异步函数的返回值。
     """
-    loop = None
-    is_new_loop = False
-    try:
-        # 尝试获取当前线程的事件循环。如果线程还没有循环，会抛出 RuntimeError。
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-             # 如果循环正在运行，直接在其中创建任务并运行直到完成
-             # 这在 gevent/eventlet worker 中可行，但在同步 worker 中可能导致问题
-             # 明确创建一个新的循环更安全，避免干扰其他地方的潜在异步代码
-             raise RuntimeError("Existing loop is running, creating new one.")
-
-    except RuntimeError: # 通常意味着没有当前事件循环，需要创建一个新的
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop) # 设置新循环为当前线程的事件循环
-        is_new_loop = True
-
-    # 如果上面获取到或创建了循环，运行异步函数
-    try:
-        # 使用 loop.run_until_complete() 运行协程直到完成
-        result = loop.run_until_complete(async_func)
-        return result
-    finally:
-        # 清理：如果创建了新的事件循环，需要关闭它
-        if is_new_loop and loop is not None and not loop.is_closed():
-            try:
-                # asyncio.run() 或 run_until_complete 在 Python 3.7+ 中应该会处理清理，
-                # 但手动关闭确保资源释放
-                loop.close()
-            except Exception:
-                # 关闭时可能出错，忽略
-                pass
-            # 恢复事件循环策略到默认，以免影响后续操作
-            asyncio.set_event_loop_policy(None)
+    loop = _get_shared_loop()
+    if _gevent_patched():
+        return _run_in_gevent(async_func, loop)
+    future = asyncio.run_coroutine_threadsafe(async_func, loop)
+    return future.result()
 
 
 # --- Edge TTS 异步合成函数 ---
+EDGE_TTS_CHUNK_TIMEOUT = 30 # 流式读取时两个数据块之间允许的最长等待时间（秒）
+EDGE_TTS_BITRATE = 48000 # edge-tts 请求的输出格式: audio-24khz-48kbitrate-mono-mp3
+
 async def _synthesize_edge_audio_async(
     voice_id: str,
     text: str,
     output_path: Path,
     rate_str: str = "+0%",
     logger: logging.Logger = logging.getLogger(__name__) # 接收 logger 并设置默认值
-):
+) -> float | None:
     """
-    内部异步函数：使用 edge-tts 库合成语音并保存到文件。
+    内部异步函数：使用 edge-tts 库合成语音并保存到文件，同时在读取数据流的过程中得到音频时长，
+    调用方无需再单独解析文件或调用 ffprobe。
 
     Args:
         voice_id: 要使用的语音 ID。
@@ -120,35 +257,147 @@ async def _synthesize_edge_audio_async(
         logger: 日志记录器实例。
 
     Returns:
-        bool: 合成并保存成功返回 True，否则返回 False。
+        合成并保存成功返回音频时长 (秒)，否则返回 None。
     """
     logger.debug(f"开始异步合成: Voice='{voice_id}', Rate='{rate_str}', Text='{text[:50]}...'") # 记录部分文本
     try:
-        # 实例化 Edge TTS Communicate 对象
-        # pitch 参数在这里被移除，因为我们的需求中不再支持通过参数控制音调
-        communicate = edge_tts.Communicate(text, voice_id, rate=rate_str)
-
-        # 使用 await communicate.save() 执行异步操作并保存到文件
-        await communicate.save(str(output_path))
-
-        logger.debug(f"异步合成完成，已保存到: {output_path.name}")
-        return True # 成功
-
+        async with _get_edge_semaphore(): # 限制同时打开的 WebSocket 连接数
+            # 实例化 Edge TTS Communicate 对象
+            # pitch 参数在这里被移除，因为我们的需求中不再支持通过参数控制音调
+            # 传入共享连接器，复用其 DNS 缓存 (WebSocket 连接本身不会被复用)
+            communicate = edge_tts.Communicate(text, voice_id, rate=rate_str, connector=_get_shared_connector())
+
+            # 逐块读取 communicate.stream() 并直接写入文件，内存中只保留当前数据块。
+            # 每个数据块设置空闲超时，避免服务端无响应时一直挂起。
+            # 时长计算: Edge TTS 固定输出 48 kbps CBR MP3，音频字节数可以直接换算为时长
+            # (edge-tts 自身也用同样方式补偿分段偏移)；同时记录边界事件的最大结束时间
+            # (offset + duration，单位 100 纳秒) 作为下限，两者取较大值。
+            # 先写入同目录下的临时文件，完成后再原子替换为 output_path：
+            # output_path 可能是硬链接到 TTS 缓存 (或其他片段) 的文件，不能在原 inode 上截断重写
+            audio_bytes = 0
+            boundary_end_ticks = 0
+            partial_path = output_path.with_name(output_path.name + ".part")
+            stream = communicate.stream()
+            try:
+                with open(partial_path, "wb") as audio_file:
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(stream.__anext__(), timeout=EDGE_TTS_CHUNK_TIMEOUT)
+                        except StopAsyncIteration:
+                            break
+                        if chunk["type"] == "audio":
+                            audio_file.write(chunk["data"])
+                            audio_bytes += len(chunk["data"])
+                        elif chunk["type"] in ("WordBoundary", "SentenceBoundary"):
+                            boundary_end_ticks = max(boundary_end_ticks, chunk["offset"] + chunk["duration"])
+                if not audio_bytes:
+                    raise NoAudioReceived("No audio was received from Edge TTS stream.")
+                os.replace(partial_path, output_path)
+            finally:
+                await stream.aclose() # 超时或出错时关闭底层 WebSocket 连接
+                partial_path.unlink(missing_ok=True) # 失败时删除写了一半的临时文件
+
+            duration = max(audio_bytes * 8 / EDGE_TTS_BITRATE, boundary_end_ticks / 1e7)
+            logger.debug(f"异步合成完成，已保存到: {output_path.name} (时长 {duration:.3f}s)")
+            return duration # 成功
+
+    except asyncio.TimeoutError:
+        logger.error(f"Edge TTS 流式读取超时 ({EDGE_TTS_CHUNK_TIMEOUT}s 无数据): Voice='{voice_id}', Rate='{rate_str}'")
+        return None # 失败
     except NoAudioReceived as e:
         # 如果服务器没有返回音频数据
         logger.error(f"Edge TTS 错误 (NoAudioReceived): Voice='{voice_id}', Rate='{rate_str}'. {e}")
-        return False # 失败
+        return None # 失败
     except EdgeTTSException as e:
         # 捕获 Edge TTS 库特有的其他异常
         logger.error(f"Edge TTS 库错误: Voice='{voice_id}', Rate='{rate_str}'. Error: {e}")
-        return False # 失败
+        return None # 失败
+    except ValueError as e:
+        # Communicate 对语音/语速等参数校验失败，重试也不会成功，交给调用者处理
+        logger.error(f"Edge TTS 参数无效: Voice='{voice_id}', Rate='{rate_str}'. Error: {e}")
+        raise
     except Exception as e:
         # 捕获其他可能的异常（如网络错误 aiohttp.ClientError 等）
         logger.error(f"异步合成时发生意外错误: Voice='{voice_id}', Rate='{rate_str}'. Error: {e}", exc_info=True)
-        return False # 失败
+        return None # 失败
+
+
+def _get_cache_settings(config: configparser.ConfigParser | None) -> tuple[Path | None, int]:
+    """
+    从配置读取 TTS 磁盘缓存设置。
+
+    Returns:
+        (缓存目录 | None, 容量上限字节数)。未提供配置或禁用缓存时目录为 None。
+    """
+    if config is None or not config.getboolean('Audio', 'tts_cache_enabled', fallback=True):
+        return None, 0
+    default_dir = Path(config.get('General', 'base_temp_dir', fallback='/tmp/ppt2video_temp')) / 'tts_cache'
+    cache_dir = Path(config.get('Audio', 'tts_cache_dir', fallback='') or default_dir)
+    max_mb = min(max(config.getint('Audio', 'tts_cache_max_mb', fallback=200), 10), 500)
+    return cache_dir, max_mb * 1024 * 1024
 
 
 # --- TTS 生成片段函数 (由 ppt_processor 调用) ---
+RETRY_MAX_DELAY = 30.0 # 单次重试等待的上限（秒）
+# 已确认存在的输出目录。同一任务的所有片段写入同一个目录，只需在第一次时调用 mkdir
+_ENSURED_DIRS: set[str] = set()
+_ENSURED_DIRS_LOCK = threading.Lock()
+RATE_DELTA_RANGE = (-100, 200) # Edge TTS 接受的语速调整范围（相对正常语速的百分比）
+
+
+@functools.lru_cache(maxsize=64)
+def _rate_to_str(rate: int) -> str:
+    """
+    把语速百分比 (100 表示正常) 转换为 Edge TTS 需要的格式 (+x% 或 -x%)。
+    一份演讲稿通常只用到少数几个语速值，结果按值缓存。
+
+    Raises:
+        ValueError: 语速超出 Edge TTS 支持的范围。
+    """
+    delta = int(rate) - 100
+    if not RATE_DELTA_RANGE[0] <= delta <= RATE_DELTA_RANGE[1]:
+        raise ValueError(f"语速 {rate}% 超出支持范围 ({100 + RATE_DELTA_RANGE[0]}%-{100 + RATE_DELTA_RANGE[1]}%)")
+    return f"{delta:+d}%"
+
+
+def _ensure_dir(directory: Path, force: bool = False):
+    """创建目录（如不存在），已确认过的目录直接跳过。force=True 时忽略记录重新检查。"""
+    key = str(directory)
+    if not force and key in _ENSURED_DIRS:
+        return
+    directory.mkdir(parents=True, exist_ok=True)
+    with _ENSURED_DIRS_LOCK:
+        _ENSURED_DIRS.add(key)
+
+
+def _validate(voice_id: str, text: str, output_path: Path, rate: int, logger: logging.Logger) -> str | None:
+    """
+    校验片段合成参数，并准备输出目录。
+
+    Returns:
+        参数有效时返回 Edge TTS 需要的语速字符串 (+x% 或 -x%)，否则记录原因并返回 None。
+    """
+    if voice_id in _VOICE_IDS and text and not text.isspace():
+        try:
+            rate_str = _rate_to_str(rate)
+        except (TypeError, ValueError) as e:
+            logger.error(f"无效的语速: {e}")
+            return None
+        # 确保父目录存在
+        try:
+            _ensure_dir(output_path.parent)
+        except OSError as e:
+            logger.error(f"无法创建音频输出目录 {output_path.parent}: {e}")
+            return None
+        return rate_str
+
+    if voice_id not in _VOICE_IDS:
+        logger.error(f"无效的语音 ID: '{voice_id}'")
+    else:
+        # 对于空文本不生成文件，返回 None 让调用者（ppt_processor）知道没有音频文件
+        logger.warning(f"文本片段为空，跳过 TTS: {output_path.name}")
+    return None
+
 def generate_audio_segment(
     voice_id: str,
     text: str,
@@ -156,8 +405,9 @@ def generate_audio_segment(
     rate: int, # 语速百分比
     logger: logging.Logger, # 接收 logger
     max_retries: int = 1, # 最大重试次数
-    retry_delay: float = 1.5 # 重试间隔（秒）
-) -> bool:
+    retry_delay: float = 1.5, # 重试间隔（秒）
+    config: configparser.ConfigParser | None = None # 配置对象，用于启用磁盘缓存
+) -> float | None:
     """
     为演讲稿的一个片段生成音频文件 (MP3)，包含重试逻辑。
     此函数是同步的，它在内部调用异步合成函数。
@@ -169,31 +419,33 @@ def generate_audio_segment(
         rate: 语速百分比 (100 表示正常)。
         logger: 日志记录器实例。
         max_retries: 最大重试次数。
-        retry_delay: 重试间隔时间（秒）。
+        retry_delay: 重试基础间隔（秒），每次重试按指数退避并加入随机抖动。
+        config: (可选) ConfigParser 对象。提供时按 [Audio] 中的 tts_cache_* 配置使用磁盘缓存。
 
     Returns:
-        True 如果成功生成音频文件, False 如果失败。
+        成功生成音频文件时返回其时长 (秒，由合成数据流或缓存清单得到)，失败返回 None。
     """
-    logger.debug(f"请求 Edge TTS 片段音频: Voice='{voice_id}', Rate={rate}%, Output='{output_path.name}', Text='{text[:50]}...'") # 记录部分文本
-    if voice_id not in KNOWN_EDGE_VOICES:
-        logger.error(f"无效的语音 ID: '{voice_id}'")
-        return False
-    if not text or text.isspace():
-        logger.warning(f"文本片段为空，跳过 TTS: {output_path.name}")
-        # 对于空文本，不生成文件，返回 True 表示“跳过生成成功”
-        # 或者返回 False 让调用者知道没有文件生成
-        # 这里返回 False，让调用者（ppt_processor）知道没有音频文件
-        return False
-
-    # 将百分比转换为 Edge TTS 需要的格式 (+x% 或 -x%)
-    rate_str = f"{rate-100:+d}%"
+    logger.debug(f"请求 Edge TTS 片段音频: Voice='{voice_id}', Rate={rate}%, Output='{output_path.name}', Text='{(text or '')[:50]}...'") # 记录部分文本
+    rate_str = _validate(voice_id, text, output_path, rate, logger)
+    if rate_str is None:
+        return None
 
-    # 确保父目录存在
-    try:
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-    except OSError as e:
-         logger.error(f"无法创建音频输出目录 {output_path.parent}: {e}")
-         return False
+    # --- 磁盘缓存：相同 (语音, 语速, 文本) 直接复用之前的合成结果 ---
+    cache_dir, cache_max_bytes = _get_cache_settings(config)
+    cache_key = None
+    if cache_dir is not None:
+        cache_key = tts_cache.cache_key(voice_id, rate_str, text)
+        if tts_cache.fetch(cache_dir, cache_key, output_path):
+            logger.info(f"  TTS 缓存命中，跳过合成: {output_path.name}")
+            duration = tts_cache.get_duration(cache_dir, cache_key)
+            if duration is None: # 旧的缓存条目没有记录时长
+                duration = get_audio_duration(output_path, logger, config)
+            if duration is not None:
+                write_duration_sidecar(output_path, duration, logger)
+                return duration
+            logger.warning(f"  缓存音频无法读取时长，删除该缓存条目并重新合成: {output_path.name}")
+            output_path.unlink(missing_ok=True) # 断开与缓存文件的硬链接
+            tts_cache.discard(cache_dir, cache_key)
 
     for attempt in range(max_retries + 1):
         success = False # 标记本次尝试是否成功生成文件
@@ -211,42 +463,55 @@ def generate_audio_segment(
             # 在同步环境中运行异步任务
             synthesis_result = run_async_in_sync(async_task_coroutine) # <--- 使用正确的变量名
 
-            # synthesis_result 是 _synthesize_edge_audio_async 的返回值 (True 或 False)
-            if synthesis_result:
+            # synthesis_result 是 _synthesize_edge_audio_async 的返回值 (时长或 None)
+            if synthesis_result is not None:
                 # 检查文件是否存在且不为空，作为最终确认
                 if output_path.exists() and output_path.stat().st_size > 100:
                     logger.info(f"  尝试 {attempt+1}/{max_retries+1}: Edge TTS 片段音频生成成功: {output_path.name}")
                     success = True # 本次尝试成功
-                    return True # 生成成功，直接返回 True
+                    write_duration_sidecar(output_path, synthesis_result, logger)
+                    if cache_key is not None:
+                        tts_cache.put(cache_dir, cache_key, output_path, cache_max_bytes, logger, duration=synthesis_result)
+                    return synthesis_result # 生成成功，直接返回时长
 
                 else:
-                    # 异步函数返回 True，但文件无效，这是一种异常情况
+                    # 异步函数返回成功，但文件无效，这是一种异常情况
                     logger.warning(f"  尝试 {attempt+1}/{max_retries+1}: 异步合成返回成功，但文件为空或过小: {output_path.name}")
-                    if output_path.exists(): output_path.unlink(missing_ok=True) # 删除无效文件
+                    output_path.unlink(missing_ok=True) # 删除无效文件
                     success = False # 本次尝试失败
             else:
-                 # 异步合成函数返回 False，表示 Edge TTS 发生了错误
+                 # 异步合成函数返回 None，表示 Edge TTS 发生了错误
                  logger.warning(f"  尝试 {attempt+1}/{max_retries+1}: 异步合成函数返回失败 for {output_path.name}")
                  success = False # 本次尝试失败
 
 
+        except ValueError as e: # 参数无效属于不可重试的错误，直接失败
+            logger.error(f"  参数无效，不再重试 {output_path.name}: {e}")
+            output_path.unlink(missing_ok=True)
+            return None
         except Exception as e: # 捕获 run_async_in_sync 或其他意外错误
             logger.error(f"  尝试 {attempt+1}/{max_retries+1}: 生成 Edge TTS 片段时发生意外错误: {e}", exc_info=True)
             success = False # 本次尝试失败
 
         # --- 重试逻辑判断 ---
         if not success and attempt < max_retries:
-            logger.info(f"将在 {retry_delay} 秒后重试 ({attempt+2}/{max_retries+1})...")
-            time.sleep(retry_delay) # 同步等待重试
+            # 指数退避 + 随机抖动，避免多个任务在服务端限流时同一时刻集中重试
+            delay = min(RETRY_MAX_DELAY, retry_delay * (2 ** attempt) * random.uniform(0.5, 1.5))
+            logger.info(f"将在 {delay:.1f} 秒后重试 ({attempt+2}/{max_retries+1})...")
+            time.sleep(delay) # 同步等待重试
+            try:
+                _ensure_dir(output_path.parent, force=True) # 目录可能在记录之后被清理，重试前重新确认
+            except OSError:
+                pass # 下一次尝试写文件时会记录具体错误
         elif not success: # 达到最大重试次数仍然失败
              logger.error(f"达到最大重试次数 ({max_retries} 次)，生成片段 '{output_path.name}' 最终失败。")
-             if output_path.exists(): output_path.unlink(missing_ok=True) # 清理可能残留的空文件
-             return False # 最终失败，返回 False
+             output_path.unlink(missing_ok=True) # 清理可能残留的空文件
+             return None # 最终失败，返回 None
 
-    # 理论上代码不会执行到这里，因为循环内要么成功返回 True，要么重试耗尽返回 False
+    # 理论上代码不会执行到这里，因为循环内要么成功返回时长，要么重试耗尽返回 None
     # 这是一个逻辑上的回退，表明流程未按预期结束
     logger.error(f"代码逻辑错误：Edge TTS 片段生成函数循环结束但未确定状态 for {output_path.name}")
-    return False # 返回 False 表示函数未成功完成
+    return None # 返回 None 表示函数未成功完成
 
 
 # --- 获取可用语音列表的函数 (由 app.py 或 tasks.py 调用) ---
@@ -258,21 +523,13 @@ def get_available_voices(logger: logging.Logger) -> list[dict]:
         logger: 日志记录器实例。
 
     Returns:
-        语音信息字典列表。
+        按显示名称排序的语音信息字典列表。列表中的字典为模块内共享对象，调用者不应修改。
     """
-    logger.info("获取预定义的 Edge TTS 语音列表。")
-    voice_list = []
-    for voice_id, details in KNOWN_EDGE_VOICES.items():
-        voice_info = details.copy()
-        voice_info['id'] = voice_id
-        voice_list.append(voice_info)
-    # 按显示名称排序
-    voice_list.sort(key=lambda x: x.get('name', ''))
-
-    if not voice_list:
+    logger.debug("获取预定义的 Edge TTS 语音列表。")
+    if not _AVAILABLE_VOICES_SORTED:
         logger.warning("预定义的 Edge TTS 语音列表为空，请检查 KNOWN_EDGE_VOICES 字典。")
 
-    return voice_list
+    return list(_AVAILABLE_VOICES_SORTED)
 
 # --- generate_preview_audio 函数 ---
 # 这个函数主要是给 GUI 或测试用的，在服务端的核心转换任务中不直接使用
@@ -292,21 +549,19 @@ def generate_preview_audio(voice_id: str, logger: logging.Logger, text: str | No
         注意：调用者负责在使用后删除此临时文件。
     """
     logger.info(f"请求 Edge TTS 预览: Voice ID='{voice_id}'")
-    if voice_id not in KNOWN_EDGE_VOICES:
+    if voice_id not in _VOICE_IDS:
         logger.error(f"预览错误：无效的语音 ID: '{voice_id}'")
         return None
 
     if text is None:
-        lang_prefix = KNOWN_EDGE_VOICES[voice_id].get('lang', 'en').split('-')[0].lower()
+        lang_prefix = _VOICE_LANG_PREFIX[voice_id]
         text = "你好，这是一个使用微软 Edge 语音合成的试听示例。" if lang_prefix == 'zh' else "Hello, this is an audio preview using Microsoft Edge speech synthesis."
 
     temp_file_path = None
     try:
-        # 创建临时文件来保存音频
-        # mkstemp 返回一个文件描述符和一个路径字符串
-        fd, temp_file_path_str = tempfile.mkstemp(suffix=".mp3", prefix="tts_preview_")
-        os.close(fd) # 关闭文件描述符，以便 edge-tts 可以通过路径打开和写入文件
-        temp_file_path = Path(temp_file_path_str)
+        # 创建临时文件来保存音频 (delete=False: 关闭后保留文件，由合成函数按路径写入)
+        with tempfile.NamedTemporaryFile(suffix=".mp3", prefix="tts_preview_", delete=False) as tf:
+            temp_file_path = Path(tf.name)
         logger.debug(f"创建临时预览文件: {temp_file_path}")
 
         # --- 调用异步合成函数并在同步环境中运行 ---
@@ -315,32 +570,32 @@ def generate_preview_audio(voice_id: str, logger: logging.Logger, text: str | No
             voice_id,
             text,
             temp_file_path,
-            "+0%", # 预览通常使用默认速率
+            _rate_to_str(100), # 预览通常使用默认速率
             logger # 传递 logger
         )
         # 在同步环境中运行异步任务
         synthesis_result = run_async_in_sync(async_task_coroutine) # <--- 使用正确的变量名
         # --- ------------- ---
 
-        if synthesis_result:
+        if synthesis_result is not None:
             # 检查文件是否存在且不为空，作为最终确认
             if temp_file_path.exists() and temp_file_path.stat().st_size > 100:
                 logger.info(f"Edge TTS 预览音频生成成功: {temp_file_path}")
-                return str(temp_file_path.resolve()) # 返回绝对路径字符串
+                return str(temp_file_path) # tempfile 返回的已是绝对路径
             else:
                 logger.error("Edge TTS 未能成功生成预览音频文件或文件为空。")
-                if temp_file_path.exists(): os.remove(temp_file_path) # 删除无效文件
+                temp_file_path.unlink(missing_ok=True) # 删除无效文件
                 return None # 失败
         else:
-             # 异步合成函数返回 False，表示 Edge TTS 发生了错误
+             # 异步合成函数返回 None，表示 Edge TTS 发生了错误
              logger.error("异步合成函数返回失败 for preview.")
-             if temp_file_path.exists(): os.remove(temp_file_path) # 删除可能残留的空文件
+             temp_file_path.unlink(missing_ok=True) # 删除可能残留的空文件
              return None # 失败
 
 
     except Exception as e:
         logger.error(f"生成 Edge TTS 预览音频时发生错误: {e}", exc_info=True)
-        if temp_file_path and temp_file_path.exists():
-            try: os.remove(temp_file_path) # 尝试清理残留文件
+        if temp_file_path:
+            try: temp_file_path.unlink(missing_ok=True) # 尝试清理残留文件
             except OSError: pass
         return None
\ No newline at end of file
@@ -10,15 +10,53 @@ import json
 import wave
 import contextlib
 import os
+import functools
+import sys
+import time
+import threading
+
+# 导入 mutagen (可选，用于在进程内读取 MP3 时长)
+try:
+    from mutagen.mp3 import MP3 as MutagenMP3
+    MUTAGEN_AVAILABLE = True
+except ImportError:
+    MUTAGEN_AVAILABLE = False
 
 # 注意：这个模块中的函数可能被不同的进程（Web服务器、Celery worker）调用，
 # 因此配置和日志最好由调用者传入，或者有一个全局初始化的方式。
 # 这里暂时假设调用者会传入 logger 和 config 对象。
 
+@functools.lru_cache(maxsize=32)
+def _resolve_tool_path(tool_name: str, configured_path: str, system: str) -> str | None:
+    """
+    解析外部工具可执行文件的绝对路径 (带缓存，每个 worker 进程只解析一次)。
+    结果只取决于参数和文件系统，不做日志记录。
+    """
+    # 尝试在 PATH 或配置路径中查找
+    tool_executable_found = shutil.which(configured_path)
+    if tool_executable_found:
+        return str(Path(tool_executable_found).resolve())
+
+    # 如果配置的不是默认名称且在 PATH 中找不到，尝试在 PATH 中查找默认名称
+    if configured_path != tool_name:
+        tool_executable_found = shutil.which(tool_name)
+        if tool_executable_found:
+            return str(Path(tool_executable_found).resolve())
+
+    # 针对 macOS 的特殊处理：检查 LibreOffice 的默认安装路径
+    if tool_name == "soffice" and system == "Darwin":
+        common_path = "/Applications/LibreOffice.app/Contents/MacOS/soffice"
+        if Path(common_path).exists():
+            return common_path
+
+    return None
+
+
 def get_tool_path(tool_name: str, logger: logging.Logger, config: configparser.ConfigParser) -> str | None:
     """
     确定外部工具（如 ffmpeg, ffprobe, soffice）的可执行文件路径。
     优先从 config.ini 的 [Paths] 部分读取，然后尝试系统 PATH。
+    解析结果按 (工具名, 配置路径) 缓存，避免每次调用都遍历 PATH。
 
     Args:
         tool_name: 工具的名称 (例如 "ffmpeg", "soffice")。
@@ -30,35 +68,34 @@ def get_tool_path(tool_name: str, logger: logging.Logger, config: configparser.C
     """
     # 优先从 config.ini 读取 tool_name 对应的路径
     tool_path_config = config.get('Paths', f'{tool_name}_path', fallback=tool_name)
-    logger.debug(f"尝试查找工具 '{tool_name}'，配置路径/名称: '{tool_path_config}'")
-
-    # 尝试在 PATH 或配置路径中查找
-    tool_executable_found = shutil.which(tool_path_config)
-    if tool_executable_found:
-        resolved_path = str(Path(tool_executable_found).resolve())
-        logger.info(f"通过 which 找到 '{tool_name}' 可执行文件: {resolved_path}")
+    resolved_path = _resolve_tool_path(tool_name, tool_path_config, platform.system())
+    if resolved_path:
+        logger.debug(f"工具 '{tool_name}' (配置: '{tool_path_config}') 解析为: {resolved_path}")
         return resolved_path
 
-    # 如果配置的不是默认名称且在 PATH 中找不到，尝试在 PATH 中查找默认名称
-    if tool_path_config != tool_name:
-        logger.debug(f"配置路径 '{tool_path_config}' 未找到，尝试在 PATH 中查找默认名称 '{tool_name}'")
-        tool_executable_found = shutil.which(tool_name)
-        if tool_executable_found:
-            resolved_path = str(Path(tool_executable_found).resolve())
-            logger.info(f"通过 which 找到默认名称 '{tool_name}' 可执行文件: {resolved_path}")
-            return resolved_path
-
-    # 针对 macOS 的特殊处理：检查 LibreOffice 的默认安装路径
-    if tool_name == "soffice" and platform.system() == "Darwin":
-        common_path = "/Applications/LibreOffice.app/Contents/MacOS/soffice"
-        if Path(common_path).exists():
-            logger.info(f"在默认 macOS 路径找到 '{tool_name}': {common_path}")
-            return common_path
-
     logger.error(f"未能找到 '{tool_name}' 可执行文件！请确保已安装，"
                  f"并将其添加到系统 PATH 环境变量，或在 config.ini 的 [Paths] 部分正确配置其路径。")
     return None
 
+
+@functools.lru_cache(maxsize=8)
+def _resolve_poppler_path(poppler_path_config: str) -> tuple[str | None, str]:
+    """
+    解析 Poppler bin 目录 (带缓存)。
+
+    Returns:
+        (绝对路径 | None, 状态)。状态为 'ok'、'missing_pdftoppm' 或 'not_dir'。
+    """
+    poppler_bin_path = Path(poppler_path_config)
+    # 检查路径是否存在并且是一个目录
+    if not poppler_bin_path.is_dir():
+        return None, 'not_dir'
+    # 进一步检查目录下是否包含关键工具 (可选但推荐)
+    if (poppler_bin_path / 'pdftoppm').exists() or (poppler_bin_path / 'pdftoppm.exe').exists():
+        return str(poppler_bin_path.resolve()), 'ok'
+    return None, 'missing_pdftoppm'
+
+
 def get_poppler_path(logger: logging.Logger, config: configparser.ConfigParser) -> str | None:
     """
     获取 Poppler 的 bin 目录路径，供 pdf2image 使用。
@@ -72,24 +109,166 @@ def get_poppler_path(logger: logging.Logger, config: configparser.ConfigParser)
         Poppler bin 目录的绝对路径字符串，如果未配置或配置无效则返回 None。
     """
     poppler_path_config = config.get('Paths', 'poppler_path', fallback=None)
-    if poppler_path_config:
-        poppler_bin_path = Path(poppler_path_config)
-        # 检查路径是否存在并且是一个目录
-        if poppler_bin_path.is_dir():
-            # 进一步检查目录下是否包含关键工具 (可选但推荐)
-            if (poppler_bin_path / 'pdftoppm').exists() or (poppler_bin_path / 'pdftoppm.exe').exists():
-                resolved_path = str(poppler_bin_path.resolve())
-                logger.info(f"使用 config.ini 中配置的 Poppler 路径: {resolved_path}")
-                return resolved_path
-            else:
-                logger.warning(f"配置的 Poppler 路径 '{poppler_path_config}' 中未找到 pdftoppm 工具。将依赖系统 PATH。")
-                return None
+    if not poppler_path_config:
+        logger.info("config.ini 中未配置 Poppler 路径，pdf2image 将依赖系统 PATH。")
+        return None
+
+    resolved_path, status = _resolve_poppler_path(poppler_path_config)
+    if status == 'ok':
+        logger.info(f"使用 config.ini 中配置的 Poppler 路径: {resolved_path}")
+    elif status == 'missing_pdftoppm':
+        logger.warning(f"配置的 Poppler 路径 '{poppler_path_config}' 中未找到 pdftoppm 工具。将依赖系统 PATH。")
+    else:
+        logger.warning(f"配置的 Poppler 路径 '{poppler_path_config}' 不是一个有效的目录。将依赖系统 PATH。")
+    return resolved_path
+
+
+def clear_tool_path_cache():
+    """清空工具路径缓存 (例如修改了 config.ini 或安装了新工具之后)。"""
+    _resolve_tool_path.cache_clear()
+    _resolve_poppler_path.cache_clear()
+
+
+# --- gevent 兼容 ---
+def gevent_patched() -> bool:
+    """当前进程是否已被 gevent 猴子补丁（例如以 `celery worker -P gevent` 启动）。"""
+    monkey = sys.modules.get("gevent.monkey")
+    return monkey is not None and monkey.is_module_patched("threading")
+
+
+def run_blocking_io(func, *args, **kwargs):
+    """
+    执行阻塞的文件系统操作（移动、删除大文件等）或进程内的 CPU 密集计算（PyAV 编码、图片渲染等）。
+    gevent worker 中交给 hub 的系统线程池执行，等待期间其他 greenlet 可以继续运行；其他情况下直接调用。
+    """
+    if gevent_patched():
+        import gevent
+        return gevent.get_hub().threadpool.apply(func, args, kwargs)
+    return func(*args, **kwargs)
+
+
+# --- 日志辅助 ---
+class LazyShellJoin:
+    """
+    延迟格式化的命令行日志参数：只有日志真正输出时才执行 shlex.join。
+    用法: logger.debug("执行命令: %s", LazyShellJoin(cmd))
+    """
+    __slots__ = ("args",)
+
+    def __init__(self, args: list[str]):
+        self.args = args
+
+    def __str__(self) -> str:
+        return shlex.join(self.args)
+
+
+# --- 任务进度上报节流 ---
+class ThrottledTaskState:
+    """
+    包装 Celery 任务实例的 update_state：每次上报都是一次结果后端 (Redis) 往返，
+    这里把 min_interval 秒内的中间进度合并掉，并丢弃与上一次完全相同的上报。
+    被合并的最新一次上报不会丢失：间隔到期后由定时器补发，或在调用 flush() 时立即发送。
+    非 PROCESSING 状态、阶段切换、错误状态 (status 以 'Error' 开头) 和 100% 进度总是立即上报。
+    其余属性转发给原任务实例，可以直接传给 core_logic 中接收 task_instance 的函数。
+    调用方在绕过包装直接写任务状态之前应先调用 flush()，避免定时补发覆盖更新的状态。
+    """
+
+    def __init__(self, task_instance, min_interval: float = 0.5):
+        self._task = task_instance
+        self._min_interval = min_interval
+        self._lock = threading.Lock() # 发送也在锁内进行，保证多个线程的上报按顺序到达结果后端
+        self._last_sent = None # (state, meta)
+        self._last_sent_at = 0.0
+        self._pending = None # 节流期间被合并的最新一次上报 (state, meta)
+        self._timer = None
+        # 定时补发在其他线程中执行，而 task.request 是线程本地的，这里提前取出任务 ID
+        self._task_id = getattr(getattr(task_instance, 'request', None), 'id', None)
+
+    def __getattr__(self, name):
+        # 其他属性 (如 request.id) 直接取自被包装的任务实例
+        return getattr(self._task, name)
+
+    def update_state(self, state=None, meta=None, force: bool = False):
+        meta = meta or {}
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._last_sent is not None:
+                last_state, last_meta = self._last_sent
+                if (state, meta) == self._last_sent:
+                    return
+                urgent = (
+                    state != 'PROCESSING'
+                    or meta.get('stage') != last_meta.get('stage')
+                    or str(meta.get('status', '')).startswith('Error')
+                    or (meta.get('progress') or 0) >= 100
+                )
+                if not urgent and now - self._last_sent_at < self._min_interval:
+                    self._pending = (state, dict(meta))
+                    if self._timer is None:
+                        self._timer = threading.Timer(self._min_interval - (now - self._last_sent_at), self.flush)
+                        self._timer.daemon = True
+                        self._timer.start()
+                    return
+            self._send(state, meta, now)
+
+    def flush(self):
+        """立即发送被节流合并的最新一次上报 (如有)，并取消定时补发。"""
+        with self._lock:
+            if self._pending is not None:
+                state, meta = self._pending
+                self._send(state, meta, time.monotonic())
+
+    def _send(self, state, meta: dict, now: float):
+        # 调用方需持有 self._lock
+        self._pending = None
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._last_sent = (state, dict(meta))
+        self._last_sent_at = now
+        if self._task_id is not None:
+            self._task.update_state(task_id=self._task_id, state=state, meta=meta)
         else:
-            logger.warning(f"配置的 Poppler 路径 '{poppler_path_config}' 不是一个有效的目录。将依赖系统 PATH。")
+            self._task.update_state(state=state, meta=meta)
+
+
+# --- 音频时长旁路文件 (.dur) ---
+# 由本流程合成的音频在生成时就已知时长，写入同名的 "<文件名>.dur" 旁路文件，
+# 之后再查询时长时直接读取，无需解析 MP3 或启动 ffprobe。
+DURATION_SIDECAR_SUFFIX = ".dur"
+
+
+def _duration_sidecar_path(filepath: Path) -> Path:
+    return filepath.with_name(filepath.name + DURATION_SIDECAR_SUFFIX)
+
+
+def write_duration_sidecar(filepath: Path, duration: float, logger: logging.Logger):
+    """
+    把已知的音频时长写入旁路文件。写入失败只记录调试日志，不影响主流程。
+
+    Args:
+        filepath: 音频文件的 Path 对象。
+        duration: 音频时长 (秒)。
+        logger: 日志记录器实例。
+    """
+    try:
+        _duration_sidecar_path(filepath).write_text(f"{duration:.6f}", encoding="ascii")
+    except OSError as e:
+        logger.debug(f"写入时长旁路文件失败 ({filepath.name}): {e}")
+
+
+def read_duration_sidecar(filepath: Path) -> float | None:
+    """
+    读取音频文件的时长旁路文件。旁路文件不存在、内容无效或比音频文件旧（音频已被重写）时返回 None。
+    """
+    sidecar = _duration_sidecar_path(filepath)
+    try:
+        if sidecar.stat().st_mtime < filepath.stat().st_mtime:
             return None
-    else:
-        logger.info("config.ini 中未配置 Poppler 路径，pdf2image 将依赖系统 PATH。")
+        duration = float(sidecar.read_text(encoding="ascii"))
+    except (OSError, ValueError):
         return None
+    return duration if duration >= 0.01 else None
 
 
 def get_audio_duration(filepath: Path, logger: logging.Logger, config: configparser.ConfigParser) -> float | None:
@@ -108,12 +287,43 @@ def get_audio_duration(filepath: Path, logger: logging.Logger, config: configpar
         logger.warning(f"尝试获取时长失败，文件无效或不存在: {filepath}")
         return None
 
+    duration = read_duration_sidecar(filepath)
+    if duration is not None:
+        logger.debug(f"从旁路文件获取 {filepath.name} 时长: {duration:.3f}s")
+        return duration
+
     # 获取 FFprobe 路径
     ffprobe_path = get_tool_path("ffprobe", logger, config)
     if ffprobe_path is None:
         logger.error("无法获取音频时长，因为找不到 ffprobe。")
         return None
 
+    # 先只查询 format.duration，输出只有一行数字，无需解析完整的 JSON 元数据
+    quick_command = [
+        ffprobe_path,
+        "-v", "error",
+        "-select_streams", "a:0",
+        "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1",
+        str(filepath.resolve())
+    ]
+    try:
+        result = subprocess.run(quick_command, timeout=15, capture_output=True, text=True, encoding='utf-8', errors='ignore')
+        if result.returncode == 0:
+            duration = float(result.stdout.strip())
+            if duration >= 0.01:
+                logger.debug(f"从 format.duration 获取 {filepath.name} 时长: {duration:.3f}s")
+                return duration
+    except subprocess.TimeoutExpired:
+        logger.error(f"执行 ffprobe 获取 {filepath.name} 时长超时。")
+        return None
+    except FileNotFoundError:
+        logger.error(f"错误：找不到 ffprobe 命令 '{ffprobe_path}'。")
+        return None
+    except ValueError:
+        pass # 输出为 N/A 或为空，回退到完整 JSON 查询
+
+    # 回退：获取完整的 format/streams 元数据，从音频流中查找时长
     command = [
         ffprobe_path,
         "-v", "quiet",           # 静默模式
@@ -124,17 +334,16 @@ def get_audio_duration(filepath: Path, logger: logging.Logger, config: configpar
     ]
 
     try:
-        logger.debug(f"执行 ffprobe 获取时长: {shlex.join(command)}")
-        # 设置 Popen 的 stderr=subprocess.PIPE 以便捕获错误输出
-        # 使用 text=True (别名 universal_newlines=True) 来处理文本模式
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding='utf-8', errors='ignore')
-        stdout, stderr = process.communicate(timeout=15) # 设置超时
-
-        if process.returncode != 0:
-            logger.error(f"执行 ffprobe 失败 for {filepath.name}。返回码: {process.returncode}")
+        logger.debug("执行 ffprobe 获取时长: %s", LazyShellJoin(command))
+        # subprocess.run 在超时时会自动杀死子进程并回收
+        result = subprocess.run(command, timeout=15, capture_output=True, text=True, encoding='utf-8', errors='ignore')
+        stdout = result.stdout
+
+        if result.returncode != 0:
+            logger.error(f"执行 ffprobe 失败 for {filepath.name}。返回码: {result.returncode}")
             logger.error(f"FFprobe 命令: {shlex.join(command)}")
-            if stderr:
-                logger.error(f"FFprobe 错误输出:\n{stderr}")
+            if result.stderr:
+                logger.error(f"FFprobe 错误输出:\n{result.stderr}")
             return None
 
         metadata = json.loads(stdout)
@@ -171,7 +380,6 @@ def get_audio_duration(filepath: Path, logger: logging.Logger, config: configpar
 
     except subprocess.TimeoutExpired:
         logger.error(f"执行 ffprobe 获取 {filepath.name} 时长超时。")
-        if process: process.kill() # 尝试杀死超时的进程
         return None
     except json.JSONDecodeError as e:
         logger.error(f"解析 ffprobe 的 JSON 输出失败 for {filepath.name}: {e}")
@@ -184,6 +392,44 @@ def get_audio_duration(filepath: Path, logger: logging.Logger, config: configpar
         logger.error(f"使用 ffprobe 获取 {filepath.name} 时长时发生未知错误: {e}", exc_info=True)
         return None
 
+# --- 进程内 MP3 时长解析 ---
+def get_audio_duration_fast(filepath: Path, logger: logging.Logger, config: configparser.ConfigParser) -> float | None:
+    """
+    获取音频文件时长 (秒)，对 MP3 优先在进程内解析，避免为每个片段启动 ffprobe 子进程。
+    依次尝试 .dur 旁路文件、mutagen，最后回退到 get_audio_duration (ffprobe)。
+
+    Args:
+        filepath: 音频文件的 Path 对象。
+        logger: 日志记录器实例。
+        config: ConfigParser 对象 (回退到 ffprobe 时使用)。
+
+    Returns:
+        音频时长 (float)，如果无法获取则返回 None。
+    """
+    if not filepath or not filepath.is_file():
+        logger.warning(f"尝试获取时长失败，文件无效或不存在: {filepath}")
+        return None
+
+    duration = read_duration_sidecar(filepath)
+    if duration is not None:
+        logger.debug(f"从旁路文件获取 {filepath.name} 时长: {duration:.3f}s")
+        return duration
+
+    if filepath.suffix.lower() == ".mp3":
+        duration = None
+        if MUTAGEN_AVAILABLE:
+            try:
+                duration = MutagenMP3(str(filepath)).info.length
+            except Exception as e:
+                logger.debug(f"mutagen 读取 {filepath.name} 时长失败: {e}")
+        if duration is not None and duration >= 0.01:
+            logger.debug(f"进程内解析 {filepath.name} 时长: {duration:.3f}s")
+            return duration
+        logger.debug(f"进程内未能解析 {filepath.name} 的时长，回退到 ffprobe。")
+
+    return get_audio_duration(filepath, logger, config)
+
+
 def get_wav_duration_fallback(filepath: Path, logger: logging.Logger) -> float:
     """
     (备用方法) 使用 wave 模块获取 WAV 文件时长，仅当 ffprobe 失败或不可用时考虑。
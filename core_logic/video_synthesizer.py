@@ -10,11 +10,17 @@ import json # 用于解析 ffprobe 输出
 import platform # 判断操作系统
 import sys # 用于获取 frozen 状态和路径
 import configparser # 导入配置解析器
-import uuid # 用于生成唯一文件名
+import functools # 缓存已加载的 Whisper 模型
+import concurrent.futures # 字幕识别与视频片段生成并行执行
+import threading # 保护进程内共享的探测缓存
+import re # 解析 SRT 时间轴
+import collections # 有界保存 FFmpeg 错误输出
+import hashlib # 识别内容相同的幻灯片片段
+import errno # 判断跨文件系统移动 (EXDEV)
 
 # 导入同级模块的工具函数
 try:
-    from .utils import get_tool_path, get_audio_duration
+    from .utils import get_tool_path, LazyShellJoin, run_blocking_io # 片段时长由 TTS 阶段直接给出 (processed_data 中的 audio_duration)，此处无需再探测
 except ImportError as e:
     logging.error(f"FATAL ERROR: 无法导入 core_logic.utils 模块: {e}")
     raise ImportError(f"无法导入 core_logic.utils 模块: {e}") from e
@@ -29,6 +35,27 @@ except ImportError:
     logging.error("FATAL ERROR: 缺少 'stable-ts' 库。请确保环境正确安装和打包包含！")
     WHISPER_AVAILABLE = False # 标记为不可用，后续函数会检查
 
+# 导入 faster-whisper (可选，[Audio] whisper_backend = faster 时直接使用 CTranslate2 INT8 推理，不经过 stable-ts)
+try:
+    from faster_whisper import WhisperModel as FasterWhisperModel
+    FASTER_WHISPER_AVAILABLE = True
+except ImportError:
+    FASTER_WHISPER_AVAILABLE = False
+
+# 导入 whisper.cpp 绑定 (可选，[Audio] whisper_backend = whispercpp 时使用，不依赖 stable-ts/PyTorch)
+try:
+    from pywhispercpp.model import Model as WhisperCppModel
+    WHISPERCPP_AVAILABLE = True
+except ImportError:
+    WHISPERCPP_AVAILABLE = False
+
+# 导入 numpy (可选，Whisper 的依赖；用于把 FFmpeg 管道输出的 PCM 直接交给 ASR)
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
 # 导入繁简转换库 (可选)
 try:
     import opencc # opencc-python-reimplemented 安装后导入名
@@ -37,6 +64,15 @@ except ImportError:
     logging.warning("缺少 'opencc-python-reimplemented' 库，将无法进行繁简转换！")
     OPENCC_AVAILABLE = False # 标记为不可用
 
+# 繁转简转换器只在模块加载时构建一次（解析词典、构建 trie 的开销较大），各次调用复用
+_OPENCC_T2S = None
+if OPENCC_AVAILABLE:
+    try:
+        _OPENCC_T2S = opencc.OpenCC('t2s.json') # Config file name only
+    except Exception as e:
+        logging.error(f"加载 OpenCC 't2s.json' 词典失败: {e}，将无法进行繁简转换！")
+        OPENCC_AVAILABLE = False
+
 # 导入图像库 (用于获取尺寸)
 try:
     from PIL import Image
@@ -46,6 +82,15 @@ except ImportError:
     PILLOW_AVAILABLE = False
 
 
+# 导入 PyAV (可选，进程内调用 libav 编码视频片段，避免每个片段启动一个 ffmpeg 进程)
+try:
+    import av
+    PYAV_AVAILABLE = True
+except ImportError:
+    logging.info("未安装 'av' (PyAV) 库，视频片段将使用 ffmpeg 命令行生成。'pip install av'")
+    PYAV_AVAILABLE = False
+
+
 # --- 可选：在 worker 启动时执行一些初始化操作 ---
 from celery import signals  # Add this import at the top of the file
 
@@ -65,13 +110,121 @@ STAGE_COMPLETE = 'Complete'
 
 
 # --- ASR 字幕生成函数 ---
-def srt_formatter(result: stable_whisper.WhisperResult, **kwargs) -> str:
+# 加载模型需要读取数百 MB 的权重并初始化，按 (模型名, 后端) 缓存在 worker 进程中，
+# 同一个 worker 处理的后续任务直接复用。内存由 Celery 的 worker_max_tasks_per_child 定期回收；
+# prefork 模式下每个子进程各持有一份模型，--concurrency 需要按模型内存大小设置。
+def _quantize_openai_whisper(model):
+    """
+    对 openai-whisper 模型的线性层做 INT8 动态量化（仅 CPU 推理有效），减少每个 token 解码时读取的权重字节数。
+    whisper 使用自定义的 Linear 子类（仅在 forward 中做 dtype 转换），需先还原为 nn.Linear 才能被量化替换。
+    """
+    import torch
+    for module in model.modules():
+        if isinstance(module, torch.nn.Linear) and type(module) is not torch.nn.Linear:
+            module.__class__ = torch.nn.Linear
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def _pin_torch_threads(threads: int):
+    """固定 PyTorch 的算子内/算子间线程数（每个进程只设置一次，interop 线程数只能在首次并行计算前设置）。"""
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass # 已经开始过并行计算时无法再修改，保持现状
+
+
+@functools.lru_cache(maxsize=2)
+def _load_whisper_model(model_name: str, backend: str, threads: int, int8: bool = True):
+    """
+    加载 Whisper 模型 (CPU)，结果在进程内缓存（量化和线程设置的开销只在首次加载时产生）。
+
+    Args:
+        model_name: 模型名称 (例如 'base')。
+        backend: 'whispercpp' 使用 whisper.cpp (pywhispercpp)，'faster' 使用 faster-whisper (CTranslate2, INT8 量化)，
+                 其他值使用 openai-whisper (PyTorch)。
+        threads: 推理使用的 CPU 线程数。
+        int8: openai-whisper 后端是否对线性层做 INT8 动态量化。
+
+    Returns:
+        (模型对象, 实际使用的后端名称)。whisper.cpp 不可用时回退到 faster-whisper，faster-whisper 不可用时回退到 openai-whisper。
+    """
+    if backend == 'whispercpp':
+        if WHISPERCPP_AVAILABLE:
+            model = WhisperCppModel(model_name, n_threads=threads, print_progress=False, print_realtime=False)
+            return model, 'whispercpp'
+        logging.warning("pywhispercpp 不可用，回退到 faster-whisper。'pip install pywhispercpp'")
+        backend = 'faster'
+    if backend == 'faster':
+        if FASTER_WHISPER_AVAILABLE:
+            model = FasterWhisperModel(
+                model_name,
+                device="cpu",
+                compute_type="int8",
+                cpu_threads=threads,
+                num_workers=1
+            )
+            return model, 'faster'
+        logging.warning("faster-whisper 不可用，回退到 openai-whisper。'pip install faster-whisper'")
+    if not WHISPER_AVAILABLE:
+        raise RuntimeError("stable-ts 库不可用，无法加载 Whisper 模型。")
+    _pin_torch_threads(threads)
+    model = stable_whisper.load_model(model_name, device="cpu")
+    if int8:
+        try:
+            model = _quantize_openai_whisper(model)
+        except Exception as e:
+            logging.warning(f"Whisper 模型 INT8 量化失败 ({e})，使用 FP32 模型。")
+    return model, 'openai'
+
+
+_MODEL_LOAD_LOCK = threading.Lock() # 同一进程内并发的识别任务 (gevent / 后台线程) 只加载一次模型
+
+
+def get_whisper_model(config: configparser.ConfigParser):
+    """
+    按 [Audio] 配置获取 Whisper 模型，进程内缓存，跨任务复用。
+
+    Returns:
+        (模型对象, 实际使用的后端名称, 是否复用了已缓存的模型)。
+    """
+    with _MODEL_LOAD_LOCK: # lru_cache 不会合并并发的未命中，加锁避免重复加载同一个模型
+        cache_info = _load_whisper_model.cache_info()
+        model, backend = _load_whisper_model(
+            config.get('Audio', 'whisper_model', fallback='base'),
+            config.get('Audio', 'whisper_backend', fallback='openai').strip().lower(),
+            config.getint('Audio', 'whisper_threads', fallback=os.cpu_count() or 1),
+            config.getboolean('Audio', 'whisper_int8', fallback=True),
+        )
+        reused = _load_whisper_model.cache_info().hits > cache_info.hits
+    return model, backend, reused
+
+
+def srt_formatter(result: "stable_whisper.WhisperResult", **kwargs) -> str:
     """
     将 stable-ts 结果格式化为 SRT 字符串。
     """
     return result.to_srt_vtt(word_level=False)
 
 
+def _srt_timestamp(seconds: float) -> str:
+    ms = max(0, round(seconds * 1000))
+    return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d},{ms % 1000:03d}"
+
+
+def segments_srt_formatter(segments) -> str:
+    """
+    将 (开始秒, 结束秒, 文本) 形式的识别片段 (faster-whisper / whisper.cpp) 格式化为 SRT 字符串。
+    """
+    blocks = []
+    for start, end, text in segments:
+        text = text.strip()
+        if text:
+            blocks.append(f"{len(blocks) + 1}\n{_srt_timestamp(start)} --> {_srt_timestamp(end)}\n{text}\n")
+    return "\n".join(blocks)
+
+
 def generate_subtitles(
     audio_file_paths: list[str], # 接受有效的音频文件路径列表
     output_srt_path: Path,
@@ -86,7 +239,10 @@ def generate_subtitles(
     """
     task_instance.update_state('PROCESSING', meta={'stage': STAGE_GENERATE_SUBTITLES, 'progress': 0, 'status': 'Starting ASR'})
     logger.debug("开始生成字幕...")
-    if not WHISPER_AVAILABLE:
+    configured_backend = config.get('Audio', 'whisper_backend', fallback='openai').strip().lower()
+    native_backend_ready = (configured_backend == 'whispercpp' and (WHISPERCPP_AVAILABLE or FASTER_WHISPER_AVAILABLE)) or \
+                           (configured_backend == 'faster' and FASTER_WHISPER_AVAILABLE)
+    if not WHISPER_AVAILABLE and not native_backend_ready:
         logger.error("stable-ts 库不可用，无法进行字幕生成。")
         task_instance.update_state('PROCESSING', meta={'stage': STAGE_GENERATE_SUBTITLES, 'status': 'Error: stable-ts not available'})
         return False
@@ -100,51 +256,64 @@ def generate_subtitles(
 
     # --- 使用 FFmpeg 合并音频 ---
     task_instance.update_state('PROCESSING', meta={'stage': STAGE_GENERATE_SUBTITLES, 'progress': 5, 'status': 'Concatenating audio for ASR'})
-    concat_list_path = temp_dir / f"audio_concat_list_{uuid.uuid4().hex[:4]}.txt"
-    combined_audio_path = temp_dir / f"combined_audio_for_asr_{uuid.uuid4().hex[:4]}.wav"
+    # temp_dir 为每个任务独立的临时目录，使用固定文件名即可
+    combined_audio_path = temp_dir / "combined_audio_for_asr.wav"
 
     ffmpeg_path = get_tool_path("ffmpeg", logger, config)
     if ffmpeg_path is None:
         logger.error("无法合并音频，因为找不到 ffmpeg。")
         task_instance.update_state('PROCESSING', meta={'stage': STAGE_GENERATE_SUBTITLES, 'status': 'Error: ffmpeg not found'})
-        if concat_list_path.exists(): concat_list_path.unlink(missing_ok=True)
         return False
 
     try:
-        with open(concat_list_path, 'w', encoding='utf-8') as f:
-            for audio_file_path in valid_audio_files:
-                safe_path = str(audio_file_path.resolve()).replace("'", "'\\''")
-                f.write(f"file '{safe_path}'\n")
-        logger.debug(f"为 FFmpeg 创建了音频合并列表: {concat_list_path.name}")
-
-        cmd_concat = [
-            ffmpeg_path, "-y",
-            "-f", "concat",
-            "-safe", "0",
-            "-i", str(concat_list_path.resolve()),
-            "-c", "copy",
-            str(combined_audio_path.resolve())
-        ]
-        logger.debug(f"执行 FFmpeg 命令合并音频: {shlex.join(cmd_concat)}")
-        result = subprocess.run(cmd_concat, capture_output=True, text=True, check=False, encoding='utf-8', errors='ignore')
-
-        if result.returncode != 0:
-            logger.error(f"FFmpeg 合并音频失败。返回码: {result.returncode}")
-            logger.error(f"FFmpeg 命令: {shlex.join(cmd_concat)}")
-            if result.stdout: logger.error(f"  FFmpeg (concat) STDOUT:\n{result.stdout}")
-            if result.stderr: logger.error(f"  FFmpeg (concat) STDERR:\n{result.stderr}")
-            if combined_audio_path.exists(): combined_audio_path.unlink(missing_ok=True)
-            task_instance.update_state('PROCESSING', meta={'stage': STAGE_GENERATE_SUBTITLES, 'status': 'Error: Audio concatenation failed'})
-            return False
-
-        logger.debug("使用 FFmpeg 合并音频完成。")
-        if concat_list_path.exists(): concat_list_path.unlink(missing_ok=True)
+        # 文件在上面已经校验过，合并列表直接通过 stdin 交给 FFmpeg
+        concat_list = _concat_list_bytes(valid_audio_files)
+
+        # 优先让 FFmpeg 把 16kHz 单声道 PCM 直接写到 stdout，在内存中交给 Whisper，不落地完整的 WAV 文件。
+        # Windows 下管道传输大块二进制数据不稳定，且需要 numpy，不满足时使用临时文件。
+        asr_input = None
+        if NUMPY_AVAILABLE and platform.system() != "Windows":
+            cmd_pipe = [
+                ffmpeg_path, "-v", "error",
+                *CONCAT_STDIN_INPUT,
+                "-vn", "-ac", "1", "-ar", "16000", "-f", "s16le", "pipe:1",
+            ]
+            logger.debug("执行 FFmpeg 命令合并音频 (管道输出): %s", LazyShellJoin(cmd_pipe))
+            result = subprocess.run(cmd_pipe, input=concat_list, capture_output=True, check=False)
+            if result.returncode == 0 and len(result.stdout) >= 3200: # 至少 0.1 秒的音频
+                asr_input = np.frombuffer(result.stdout, dtype=np.int16).astype(np.float32) / 32768.0
+                logger.debug(f"使用 FFmpeg 合并音频完成 (内存中 {asr_input.shape[0] / 16000:.1f} 秒)。")
+            else:
+                logger.warning(f"FFmpeg 管道合并音频失败 (返回码: {result.returncode})，改用临时文件。")
+                if result.stderr: logger.debug(f"  FFmpeg (concat pipe) STDERR:\n{result.stderr.decode('utf-8', errors='ignore')}")
 
-        if not combined_audio_path.exists() or combined_audio_path.stat().st_size < 100:
-            logger.error(f"FFmpeg 合并音频后文件无效或为空: {combined_audio_path.name}")
-            if combined_audio_path.exists(): combined_audio_path.unlink(missing_ok=True)
-            task_instance.update_state('PROCESSING', meta={'stage': STAGE_GENERATE_SUBTITLES, 'status': 'Error: Empty combined audio'})
-            return False
+        if asr_input is None:
+            cmd_concat = [
+                ffmpeg_path, "-y",
+                *CONCAT_STDIN_INPUT,
+                # 直接输出 Whisper 使用的 16kHz 单声道 PCM，识别时无需再重采样
+                "-vn", "-ac", "1", "-ar", "16000", "-c:a", "pcm_s16le",
+                os.path.abspath(combined_audio_path)
+            ]
+            logger.debug("执行 FFmpeg 命令合并音频: %s", LazyShellJoin(cmd_concat))
+            returncode, stderr_tail = run_ffmpeg(cmd_concat, concat_list)
+
+            if returncode != 0:
+                logger.error(f"FFmpeg 合并音频失败。返回码: {returncode}")
+                logger.error(f"FFmpeg 命令: {shlex.join(cmd_concat)}")
+                if stderr_tail: logger.error(f"  FFmpeg (concat) STDERR:\n{stderr_tail}")
+                combined_audio_path.unlink(missing_ok=True)
+                task_instance.update_state('PROCESSING', meta={'stage': STAGE_GENERATE_SUBTITLES, 'status': 'Error: Audio concatenation failed'})
+                return False
+
+            logger.debug("使用 FFmpeg 合并音频完成。")
+
+            if not combined_audio_path.exists() or combined_audio_path.stat().st_size < 100:
+                logger.error(f"FFmpeg 合并音频后文件无效或为空: {combined_audio_path.name}")
+                combined_audio_path.unlink(missing_ok=True)
+                task_instance.update_state('PROCESSING', meta={'stage': STAGE_GENERATE_SUBTITLES, 'status': 'Error: Empty combined audio'})
+                return False
+            asr_input = str(combined_audio_path)
 
         task_instance.update_state('PROCESSING', meta={'stage': STAGE_GENERATE_SUBTITLES, 'progress': 10, 'status': 'Audio concatenated'})
 
@@ -152,56 +321,68 @@ def generate_subtitles(
     except FileNotFoundError:
         logger.error(f"错误：找不到 FFmpeg 命令 '{ffmpeg_path}'。")
         task_instance.update_state('PROCESSING', meta={'stage': STAGE_GENERATE_SUBTITLES, 'status': 'Error: ffmpeg not found'})
-        if concat_list_path.exists(): concat_list_path.unlink(missing_ok=True)
-        if combined_audio_path.exists(): combined_audio_path.unlink(missing_ok=True)
+        combined_audio_path.unlink(missing_ok=True)
         return False
     except Exception as e:
         logger.error(f"合并音频时发生错误: {e}", exc_info=True)
         task_instance.update_state('PROCESSING', meta={'stage': STAGE_GENERATE_SUBTITLES, 'status': f'Error: Audio concatenation failed ({type(e).__name__})'})
-        if concat_list_path.exists(): concat_list_path.unlink(missing_ok=True)
-        if combined_audio_path.exists(): combined_audio_path.unlink(missing_ok=True)
+        combined_audio_path.unlink(missing_ok=True)
         return False
 
     # --- 运行 Whisper ASR ---
-    model = None
     whisper_model_name = config.get('Audio', 'whisper_model', fallback='base')
-    logger.info(f"加载 Whisper 模型 '{whisper_model_name}'，并强制使用 CPU...")
-
-    original_tqdm_disable = os.environ.get('TQDM_DISABLE')
+    whisper_backend = config.get('Audio', 'whisper_backend', fallback='openai').strip().lower()
+    whisper_language = config.get('Audio', 'whisper_language', fallback='').strip() or None # 指定语言可跳过语言检测
+    logger.info(f"获取 Whisper 模型 '{whisper_model_name}' (后端: {whisper_backend})，并强制使用 CPU...")
 
     try:
-        os.environ['TQDM_DISABLE'] = '1'
-
         task_instance.update_state('PROCESSING', meta={'stage': STAGE_GENERATE_SUBTITLES, 'progress': 15, 'status': 'Loading ASR model'})
         asr_start_time = time.time()
         # 强制 CPU 加载和推理
-        model = stable_whisper.load_model(whisper_model_name, device="cpu")
-        logger.info(f"已加载 Whisper 模型 '{whisper_model_name}'，实际使用设备: {model.device}")
+        model, whisper_backend, reused = get_whisper_model(config)
+        logger.info(f"{'复用已缓存的' if reused else '已加载'} Whisper 模型 '{whisper_model_name}' (后端: {whisper_backend})")
 
         task_instance.update_state('PROCESSING', meta={'stage': STAGE_GENERATE_SUBTITLES, 'progress': 20, 'status': 'Running ASR'})
         logger.info("开始语音识别 (ASR)...")
         # transcribe 函数本身是同步的，运行在 worker 进程中
-        result = model.transcribe(
-            str(combined_audio_path),
-            fp16=False,
-            verbose=True, # 设置 verbose=True，让 whisper 库自己的进度条显示
-            # device="cpu", # 确保这里不意外使用 GPU
-            # task=self # stable-whisper 或 whisper 库没有直接支持接收 Celery 任务实例进行进度更新
-        )
+        # stable-whisper 或 whisper 库没有直接支持接收 Celery 任务实例进行进度更新
+        if whisper_backend == 'whispercpp':
+            # whisper.cpp 接受文件路径或 16kHz float32 数组，返回带 t0/t1/text 的片段列表
+            srt_content = segments_srt_formatter((seg.t0 / 100, seg.t1 / 100, seg.text) for seg in model.transcribe(asr_input, language=whisper_language or 'auto'))
+        elif whisper_backend == 'faster':
+            # 直接调用 faster-whisper (不经过 stable-ts 的时间戳再处理)；默认贪心解码 + VAD 跳过静音段
+            # (Silero VAD 只把语音部分送入解码，输出时间戳仍对应原始音频，不影响字幕对齐)
+            vad_threshold = config.getfloat('Audio', 'whisper_vad_threshold', fallback=None)
+            segments, _info = model.transcribe(
+                asr_input,
+                language=whisper_language,
+                beam_size=config.getint('Audio', 'whisper_beam_size', fallback=1),
+                vad_filter=config.getboolean('Audio', 'whisper_vad', fallback=True),
+                vad_parameters={"threshold": vad_threshold} if vad_threshold is not None else None,
+            )
+            # segments 是惰性生成器：边解码边格式化为 SRT 文本，不保留中间的片段对象列表
+            srt_content = segments_srt_formatter((seg.start, seg.end, seg.text) for seg in segments)
+        else:
+            result = model.transcribe(
+                asr_input, # 文件路径或 16kHz float32 numpy 数组
+                language=whisper_language,
+                fp16=False, # CPU 推理不支持 FP16
+                verbose=None, # 不逐段打印识别结果，也不显示进度条
+            )
+            srt_content = srt_formatter(result)
+            del result # 释放带词级时间戳的完整识别结果
         asr_end_time = time.time()
         logger.info(f"语音识别完成，耗时 {asr_end_time - asr_start_time:.2f} 秒。")
         task_instance.update_state('PROCESSING', meta={'stage': STAGE_GENERATE_SUBTITLES, 'progress': 90, 'status': 'ASR complete'})
 
 
-        logger.debug(f"将结果格式化并保存到 {output_srt_path.name}...")
+        logger.debug(f"将字幕保存到 {output_srt_path.name}...")
 
         # --- 繁简转换 (根据配置决定是否执行) ---
-        srt_content = srt_formatter(result)
         enable_opencc = config.getboolean('General', 'enable_opencc', fallback=False)
         if enable_opencc and OPENCC_AVAILABLE:
             try:
-                cc = opencc.OpenCC('t2s.json') # Config file name only
-                srt_content = cc.convert(srt_content)
+                srt_content = _OPENCC_T2S.convert(srt_content)
                 logger.info("成功使用 OpenCC 将字幕内容转换为简体。")
                 task_instance.update_state('PROCESSING', meta={'stage': STAGE_GENERATE_SUBTITLES, 'progress': 92, 'status': 'OpenCC conversion complete'})
             except Exception as e:
@@ -222,12 +403,8 @@ def generate_subtitles(
         srt_is_valid = False
         try:
             if output_srt_path.exists() and output_srt_path.stat().st_size > 5:
-                 with open(output_srt_path, 'r', encoding='utf-8') as f:
-                     for line in f:
-                         line_strip = line.strip()
-                         if line_strip and '-->' in line_strip or (line_strip and not line_strip.isdigit()):
-                             srt_is_valid = True
-                             break
+                 # 刚写入的内容仍在内存中，无需重新读取文件；包含时间轴即视为有效
+                 srt_is_valid = '-->' in srt_content
                  if srt_is_valid:
                       logger.info("生成的 SRT 字幕文件包含有效文本。")
                       task_instance.update_state('PROCESSING', meta={'stage': STAGE_GENERATE_SUBTITLES, 'progress': 95, 'status': 'SRT file generated'})
@@ -237,11 +414,11 @@ def generate_subtitles(
                       task_instance.update_state('PROCESSING', meta={'stage': STAGE_GENERATE_SUBTITLES, 'status': 'Error: SRT file invalid or empty'})
             else:
                  logger.warning("生成的 SRT 文件过小或为空。")
-                 if output_srt_path.exists(): output_srt_path.unlink(missing_ok=True)
+                 output_srt_path.unlink(missing_ok=True)
                  task_instance.update_state('PROCESSING', meta={'stage': STAGE_GENERATE_SUBTITLES, 'status': 'Error: SRT file too small or empty'})
         except Exception as e:
              logger.error(f"检查生成的 SRT 文件有效性时出错: {e}", exc_info=True)
-             if output_srt_path.exists(): output_srt_path.unlink(missing_ok=True)
+             output_srt_path.unlink(missing_ok=True)
              task_instance.update_state('PROCESSING', meta={'stage': STAGE_GENERATE_SUBTITLES, 'status': f'Error: SRT validation failed ({type(e).__name__})'})
 
 
@@ -253,21 +430,286 @@ def generate_subtitles(
 
     except Exception as e:
         logger.error(f"运行 Whisper ASR 或保存字幕时出错: {e}", exc_info=True)
-        if output_srt_path.exists(): output_srt_path.unlink(missing_ok=True)
+        output_srt_path.unlink(missing_ok=True)
         task_instance.update_state('PROCESSING', meta={'stage': STAGE_GENERATE_SUBTITLES, 'status': f'Error: ASR failed ({type(e).__name__})'})
         return False
-    finally:
-        if original_tqdm_disable is None:
-            if 'TQDM_DISABLE' in os.environ: del os.environ['TQDM_DISABLE']
-        else:
-            os.environ['TQDM_DISABLE'] = original_tqdm_disable
-
-        if model is not None:
-             logger.debug("尝试释放 Whisper 模型内存...")
-             del model
 
 
 # --- FFmpeg 核心功能函数 ---
+SEGMENT_ENCODE_THREADS = 2 # 每个片段编码进程使用的默认线程数 (片段之间并行)，可用 [Video] segment_threads 覆盖
+FFMPEG_STDERR_TAIL_LINES = 200 # 失败时保留的 FFmpeg 错误输出行数
+
+
+def run_ffmpeg(cmd: list[str], input_data: bytes | None = None) -> tuple[int, str]:
+    """
+    运行 FFmpeg 命令并返回 (返回码, 错误输出的最后若干行)。
+
+    只输出错误级别日志且关闭进度统计，stdout 丢弃，stderr 逐行读入有界队列：
+    长视频编码时不会把整段 FFmpeg 输出都缓存在内存中。找不到可执行文件时抛出 FileNotFoundError。
+
+    Args:
+        cmd: FFmpeg 命令行 (第一个元素为可执行文件路径)。
+        input_data: (可选) 写入 FFmpeg stdin 的数据，例如 concat 列表 (配合 CONCAT_STDIN_INPUT)。
+    """
+    full_cmd = [cmd[0], "-hide_banner", "-loglevel", "error", "-nostats", *cmd[1:]]
+    stderr_tail = collections.deque(maxlen=FFMPEG_STDERR_TAIL_LINES)
+    stdin = subprocess.DEVNULL if input_data is None else subprocess.PIPE
+    with subprocess.Popen(full_cmd, stdin=stdin, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE) as proc:
+        writer = None
+        if input_data is not None:
+            # 在单独的线程中写 stdin，避免列表较大时与读取 stderr 互相阻塞
+            writer = threading.Thread(target=_write_stdin, args=(proc.stdin, input_data), daemon=True)
+            writer.start()
+        for line in proc.stderr:
+            stderr_tail.append(line.decode('utf-8', errors='ignore').rstrip('\n'))
+        returncode = proc.wait()
+        if writer is not None:
+            writer.join()
+    return returncode, "\n".join(stderr_tail)
+
+
+def _write_stdin(stdin, data: bytes):
+    try:
+        stdin.write(data)
+        stdin.close()
+    except (BrokenPipeError, OSError):
+        pass # FFmpeg 提前退出，错误由返回码和 stderr 反映
+
+# --- 硬件视频编码器 ---
+# [Video] encoder 可选 auto / x264 / nvenc / qsv / videotoolbox (或 vt)；auto 时按平台顺序探测可用的硬件编码器。
+HW_ENCODERS = {
+    'nvenc': 'h264_nvenc',
+    'qsv': 'h264_qsv',
+    'videotoolbox': 'h264_videotoolbox',
+}
+HW_ENCODER_ALIASES = {'vt': 'videotoolbox', 'h264_nvenc': 'nvenc', 'h264_qsv': 'qsv', 'h264_videotoolbox': 'videotoolbox'}
+
+
+# --- 音频流复制 ---
+# MP4 容器可直接封装的音频编码；TTS 输出（Edge TTS 为 MP3）属于其中之一时，生成片段时直接复制音频流，
+# 省去每个片段单独启动一次 AAC 编码器。后续 concat 使用流复制，各片段音频编码一致即可。
+MP4_COPYABLE_AUDIO_CODECS = {'aac', 'mp3'}
+_AUDIO_CODEC_BY_SUFFIX: dict[str, str | None] = {} # 同一任务的 TTS 文件格式相同，按扩展名只探测一次
+_AUDIO_CODEC_LOCK = threading.Lock()
+
+
+def _probe_audio_codec(audio_path: Path, logger: logging.Logger, config: configparser.ConfigParser) -> str | None:
+    """
+    返回音频文件第一条音频流的编码名称（如 'mp3'、'aac'），结果按扩展名缓存。探测失败返回 None。
+    """
+    suffix = audio_path.suffix.lower()
+    with _AUDIO_CODEC_LOCK:
+        if suffix in _AUDIO_CODEC_BY_SUFFIX:
+            return _AUDIO_CODEC_BY_SUFFIX[suffix]
+
+    codec = None
+    ffprobe_path = get_tool_path("ffprobe", logger, config)
+    if ffprobe_path is not None:
+        command = [
+            ffprobe_path, "-v", "error", "-select_streams", "a:0",
+            "-show_entries", "stream=codec_name", "-of", "default=noprint_wrappers=1:nokey=1",
+            os.path.abspath(audio_path),
+        ]
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, check=False, encoding='utf-8', errors='ignore', timeout=15)
+            if result.returncode == 0 and result.stdout.strip():
+                codec = result.stdout.strip().splitlines()[0]
+        except (OSError, subprocess.TimeoutExpired) as e:
+            logger.debug(f"探测音频编码失败 ({audio_path.name}): {e}")
+    if codec is None:
+        return None # 不缓存失败结果，下次重试
+    logger.debug(f"音频编码探测结果: {suffix} -> {codec}")
+    with _AUDIO_CODEC_LOCK:
+        _AUDIO_CODEC_BY_SUFFIX[suffix] = codec
+    return codec
+
+
+@functools.lru_cache(maxsize=4)
+def _detect_hw_encoder(ffmpeg_path: str) -> str | None:
+    """
+    探测当前 FFmpeg 可用的 H.264 硬件编码器，结果按 ffmpeg 路径缓存（每个进程只探测一次）。
+
+    仅出现在 `ffmpeg -encoders` 列表中并不代表可用（例如没有显卡或驱动），
+    因此对每个候选编码器做一次极短的测试编码。
+
+    Returns:
+        HW_ENCODERS 中的键，没有可用的硬件编码器时返回 None。
+    """
+    try:
+        result = subprocess.run([ffmpeg_path, "-hide_banner", "-encoders"], capture_output=True, text=True,
+                                check=False, encoding='utf-8', errors='ignore', timeout=10)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    order = ['videotoolbox', 'nvenc', 'qsv'] if platform.system() == "Darwin" else ['nvenc', 'qsv']
+    for key in order:
+        encoder = HW_ENCODERS[key]
+        if encoder not in result.stdout:
+            continue
+        test_cmd = [ffmpeg_path, "-hide_banner", "-loglevel", "error", "-f", "lavfi", "-i", "color=s=256x256:d=0.1",
+                    "-c:v", encoder, "-f", "null", "-"]
+        try:
+            if subprocess.run(test_cmd, capture_output=True, check=False, timeout=15).returncode == 0:
+                return key
+        except (OSError, subprocess.TimeoutExpired):
+            continue
+    return None
+
+
+def _segment_threads(config: configparser.ConfigParser) -> int:
+    """单个片段编码使用的线程数 ([Video] segment_threads)。"""
+    return max(1, config.getint('Video', 'segment_threads', fallback=SEGMENT_ENCODE_THREADS))
+
+
+def _segment_preset(config: configparser.ConfigParser) -> str:
+    """片段编码的 libx264 预设 ([Video] segment_preset)。"""
+    return config.get('Video', 'segment_preset', fallback='veryfast')
+
+
+def _x264_still_params(fps: int) -> str:
+    """
+    幻灯片片段的 libx264 调优参数：画面静止，关闭场景切换检测并缩短前瞻 (rc-lookahead)，
+    省去对重复帧的分析；GOP 固定为 10 秒。
+    """
+    return f"keyint={fps * 10}:min-keyint={fps}:scenecut=0:rc-lookahead=10"
+
+
+def _segment_x264_options(fps: int) -> dict[str, str]:
+    """片段编码附加的 libx264 选项 (tune stillimage + 静止画面调优)，PyAV 与命令行共用。"""
+    return {"tune": "stillimage", "x264-params": _x264_still_params(fps)}
+
+
+def _video_encoder_args(
+    ffmpeg_path: str,
+    config: configparser.ConfigParser,
+    preset: str,
+    crf: str,
+    threads: int,
+    logger: logging.Logger,
+    x264_options: dict[str, str] | None = None
+) -> list[str]:
+    """
+    根据 [Video] encoder 配置返回 FFmpeg 视频编码参数。硬件编码器不可用时回退到 libx264。
+
+    Args:
+        ffmpeg_path: FFmpeg 可执行文件路径。
+        config: 配置对象。
+        preset: libx264 预设。
+        crf: 质量参数 (libx264 的 CRF，对硬件编码器映射为对应的恒定质量参数)。
+        threads: libx264 线程数 (0 表示自动)，硬件编码器忽略此参数。
+        logger: 日志记录器实例。
+        x264_options: (可选) 使用 libx264 时附加的选项，如 {"tune": "stillimage"}。
+
+    Returns:
+        FFmpeg 命令行中的视频编码参数列表。
+    """
+    choice = config.get('Video', 'encoder', fallback=config.get('Video', 'hw_encoder', fallback='auto')).strip().lower()
+    choice = HW_ENCODER_ALIASES.get(choice, choice)
+    key = None
+    if choice == 'auto':
+        key = _detect_hw_encoder(ffmpeg_path)
+    elif choice in HW_ENCODERS:
+        key = choice
+    elif choice not in ('x264', 'libx264'):
+        logger.warning(f"未知的视频编码器配置 '{choice}'，使用 libx264。")
+
+    if key == 'nvenc':
+        return ["-c:v", "h264_nvenc", "-preset", "p4", "-rc", "vbr", "-cq", crf, "-b:v", "0"]
+    if key == 'qsv':
+        return ["-c:v", "h264_qsv", "-preset", "veryfast", "-global_quality", crf]
+    if key == 'videotoolbox':
+        return ["-c:v", "h264_videotoolbox", "-b:v", "4M"]
+    return _x264_args(preset, crf, threads, x264_options)
+
+
+def _x264_args(preset: str, crf: str, threads: int, x264_options: dict[str, str] | None = None) -> list[str]:
+    """libx264 的命令行编码参数。"""
+    args = ["-c:v", "libx264", "-preset", preset, "-crf", crf, "-threads", str(threads)]
+    for name, value in (x264_options or {}).items():
+        args += [f"-{name}", value]
+    return args
+
+
+def _render_slide_canvas(image_path: Path, target_width: int, target_height: int) -> "Image.Image":
+    """用 Pillow 把幻灯片等比缩放并居中填充到 target_width x target_height 的黑色画布上。"""
+    with Image.open(image_path) as img:
+        img = img.convert("RGB")
+        scale = min(target_width / img.width, target_height / img.height)
+        size = (max(2, int(img.width * scale) // 2 * 2), max(2, int(img.height * scale) // 2 * 2))
+        canvas = Image.new("RGB", (target_width, target_height), (0, 0, 0))
+        canvas.paste(img.resize(size, Image.LANCZOS), ((target_width - size[0]) // 2, (target_height - size[1]) // 2))
+    return canvas
+
+
+def _prerender_slide(image_path: Path, canvas_path: Path, target_width: int, logger: logging.Logger) -> Path | None:
+    """
+    ffmpeg 命令行路径使用：预先把幻灯片渲染成目标尺寸的画布，FFmpeg 端不再需要 scale/pad 滤镜。
+    保存为无压缩 BMP，-loop 1 逐帧重复读取时解码开销最小。Pillow 不可用或渲染失败时返回 None。
+    """
+    if not PILLOW_AVAILABLE:
+        return None
+    try:
+        _render_slide_canvas(image_path, target_width, target_width * 9 // 16).save(canvas_path, format="BMP")
+        return canvas_path
+    except (OSError, ValueError) as e:
+        logger.debug(f"  预渲染幻灯片画布失败 ({image_path.name}): {e}，使用 FFmpeg 缩放。")
+        canvas_path.unlink(missing_ok=True)
+        return None
+
+
+def _create_video_segment_pyav(
+    image_path: Path,
+    duration: float,
+    audio_path: Path | None,
+    output_path: Path,
+    target_width: int,
+    target_fps: int,
+    threads: int = SEGMENT_ENCODE_THREADS,
+    preset: str = "veryfast"
+):
+    """
+    使用 PyAV 在进程内生成视频片段，参数与输出格式和 ffmpeg 命令行路径一致
+    (等比缩放并居中填充到 16:9、H.264 crf 23 + 静止画面调优、AAC 128k)。失败时抛出异常。
+    """
+    target_height = target_width * 9 // 16
+    canvas = _render_slide_canvas(image_path, target_width, target_height)
+    # 画面是静止的，只需转换一次像素格式，之后每帧复用同一个 VideoFrame
+    video_frame = av.VideoFrame.from_image(canvas).reformat(format="yuv420p")
+
+    audio_container = av.open(str(audio_path)) if audio_path else None
+    try:
+        if audio_container is not None and audio_container.duration:
+            duration = min(duration, audio_container.duration / av.time_base) # 等同于 -shortest
+        with av.open(str(output_path), "w", format="mp4") as out:
+            video_stream = out.add_stream("libx264", rate=target_fps)
+            video_stream.width = target_width
+            video_stream.height = target_height
+            video_stream.pix_fmt = "yuv420p"
+            video_stream.options = {"preset": preset, "crf": "23", **_segment_x264_options(target_fps)}
+            video_stream.codec_context.thread_count = threads
+
+            audio_in = audio_stream = None
+            if audio_container is not None:
+                audio_in = audio_container.streams.audio[0]
+                audio_stream = out.add_stream("aac", rate=audio_in.rate)
+                audio_stream.layout = audio_in.layout.name # 保持声道数与源音频一致 (与 ffmpeg 路径相同)
+                audio_stream.bit_rate = 128000
+
+            for i in range(max(1, round(duration * target_fps))):
+                video_frame.pts = i
+                out.mux(video_stream.encode(video_frame))
+            out.mux(video_stream.encode(None))
+
+            if audio_stream is not None:
+                for audio_frame in audio_container.decode(audio_in):
+                    if audio_frame.time is not None and audio_frame.time >= duration:
+                        break
+                    audio_frame.pts = None # 由编码器重新生成时间戳
+                    out.mux(audio_stream.encode(audio_frame))
+                out.mux(audio_stream.encode(None))
+    finally:
+        if audio_container is not None:
+            audio_container.close()
+
 
 def create_video_segment(
     image_path: Path,
@@ -284,12 +726,6 @@ def create_video_segment(
     logger.debug(f"  使用 FFmpeg 创建视频片段: {output_path.name} (目标时长: {duration:.3f}s)")
     # task_instance.update_state('PROCESSING', meta={'stage': STAGE_VIDEO_SEGMENTS, 'status': f'Creating segment for {output_path.name}'})
 
-
-    ffmpeg_path = get_tool_path("ffmpeg", logger, config)
-    if ffmpeg_path is None:
-         logger.error("FFmpeg 路径未解析，无法创建视频片段。")
-         # task_instance.update_state('PROCESSING', meta={'stage': STAGE_VIDEO_SEGMENTS, 'status': 'Error: ffmpeg not found'})
-         return False
     if not image_path.is_file():
          logger.error(f"图片文件不存在: {image_path}")
          return False
@@ -299,89 +735,258 @@ def create_video_segment(
 
     target_width = config.getint('Video', 'target_width', fallback=1280)
     target_fps = config.getint('Video', 'target_fps', fallback=24)
+    audio_is_valid = audio_path and audio_path.is_file() and audio_path.stat().st_size > 100
+
+    # --- 优先在进程内用 PyAV 编码，失败时回退到 ffmpeg 命令行 ---
+    # gevent worker 中片段线程池的线程只是 greenlet，进程内编码会阻塞 hub (连带其他任务的 Edge TTS 流)，
+    # 因此经 run_blocking_io 交给 hub 的系统线程池执行
+    use_pyav = PYAV_AVAILABLE and PILLOW_AVAILABLE and config.getboolean('Video', 'use_pyav', fallback=True)
+    if use_pyav:
+        try:
+            run_blocking_io(_create_video_segment_pyav, image_path, duration, audio_path if audio_is_valid else None, output_path, target_width, target_fps, _segment_threads(config), _segment_preset(config))
+            logger.debug(f"    已通过 PyAV 生成视频片段 {output_path.name}")
+            return True
+        except Exception as e:
+            logger.warning(f"  PyAV 生成视频片段失败 ({output_path.name}): {e}，回退到 ffmpeg 命令行。")
+            output_path.unlink(missing_ok=True)
+
+    ffmpeg_path = get_tool_path("ffmpeg", logger, config)
+    if ffmpeg_path is None:
+         logger.error("FFmpeg 路径未解析，无法创建视频片段。")
+         # task_instance.update_state('PROCESSING', meta={'stage': STAGE_VIDEO_SEGMENTS, 'status': 'Error: ffmpeg not found'})
+         return False
+
+    # 画布由 Pillow 预先渲染好时，FFmpeg 只需做像素格式转换
+    canvas_path = run_blocking_io(_prerender_slide, image_path, output_path.with_name(f"{output_path.stem}_canvas.bmp"), target_width, logger)
 
-    temp_video_path = output_path.with_suffix(".temp_video_" + uuid.uuid4().hex[:4] + ".mp4")
-    step1_success = False
+    # 路径只解析一次，构建命令行时复用
+    image_s = os.path.abspath(canvas_path or image_path)
+    audio_s = os.path.abspath(audio_path) if audio_is_valid else None
+    output_s = os.path.abspath(output_path)
 
-    cmd_step1 = [
+    # 图片转视频与合并音频在同一条 FFmpeg 命令中完成，不再生成中间的无声视频文件
+    cmd = [
         ffmpeg_path, "-y",
         "-loop", "1", "-framerate", str(target_fps),
-        "-i", str(image_path.resolve()),
-        "-vf", f"scale={target_width}:-2:force_original_aspect_ratio=decrease,pad={target_width}:{target_width*9//16}:(ow-iw)/2:(oh-ih)/2,format=yuv420p,fps={target_fps}",
-        "-t", f"{duration:.3f}",
-        "-c:v", "libx264", "-preset", "veryfast", "-crf", "23",
-        "-pix_fmt", "yuv420p", "-an", str(temp_video_path.resolve())
+        "-i", image_s,
     ]
+    if audio_is_valid:
+        # 显式选择流：视频只取图片输入，音频只取第一路音频 (MP3 中若带封面图片不会被当作视频流选中)
+        cmd += ["-i", audio_s, "-map", "0:v:0", "-map", "1:a:0"]
+    scale_pad = "" if canvas_path else f"scale={target_width}:-2:force_original_aspect_ratio=decrease,pad={target_width}:{target_width*9//16}:(ow-iw)/2:(oh-ih)/2,"
+    cmd += [
+        "-vf", f"{scale_pad}format=yuv420p,fps={target_fps}",
+    ]
+    if use_pyav:
+        # PyAV 片段固定用 libx264 编码，回退时保持一致，保证后续 concat 流复制时各片段参数相同
+        cmd += _x264_args(_segment_preset(config), "23", _segment_threads(config), _segment_x264_options(target_fps))
+    else:
+        # 多个片段并行编码，限制单个 libx264 进程的线程数避免过度订阅 CPU；配置了硬件编码器时交给 GPU
+        cmd += _video_encoder_args(ffmpeg_path, config, _segment_preset(config), "23", _segment_threads(config), logger, _segment_x264_options(target_fps))
+    cmd += [
+        "-pix_fmt", "yuv420p",
+    ]
+    if audio_is_valid:
+        # PyAV 片段的音频统一编码为 AAC，回退时同样转码；否则 MP4 可直接封装的音频直接复制流
+        if not use_pyav and _probe_audio_codec(audio_path, logger, config) in MP4_COPYABLE_AUDIO_CODECS:
+            cmd += ["-c:a", "copy"]
+        else:
+            cmd += ["-c:a", "aac", "-b:a", "128k"]
+        cmd += ["-t", f"{duration:.3f}", "-shortest"]
+    else:
+        cmd += ["-an", "-t", f"{duration:.3f}"]
+    cmd.append(output_s)
+
     try:
-        logger.debug(f"    执行 FFmpeg 命令 (步骤 1 - 图片转无声视频): {shlex.join(cmd_step1)}")
-        result1 = subprocess.run(cmd_step1, capture_output=True, text=True, check=False, encoding='utf-8', errors='ignore')
-        if result1.returncode != 0:
-            logger.error(f"  FFmpeg 创建无声视频失败: {temp_video_path.name}。返回码: {result1.returncode}")
-            logger.error(f"  FFmpeg 命令: {shlex.join(cmd_step1)}")
-            if result1.stdout: logger.error(f"  FFmpeg (step1) STDOUT:\n{result1.stdout}")
-            if result1.stderr: logger.error(f"  FFmpeg (step1) STDERR:\n{result1.stderr}")
-            if temp_video_path.exists(): temp_video_path.unlink(missing_ok=True)
-            # task_instance.update_state('PROCESSING', meta={'stage': STAGE_VIDEO_SEGMENTS, 'status': f'Error creating segment {output_path.name} ({result1.returncode})'})
+        logger.debug("    执行 FFmpeg 命令 (图片%s转视频): %s", '+音频' if audio_is_valid else '', LazyShellJoin(cmd))
+        returncode, stderr_tail = run_ffmpeg(cmd)
+        if returncode != 0:
+            logger.error(f"  FFmpeg 创建视频片段失败: {output_path.name}。返回码: {returncode}")
+            logger.error(f"  FFmpeg 命令: {shlex.join(cmd)}")
+            if stderr_tail: logger.error(f"  FFmpeg (segment) STDERR:\n{stderr_tail}")
+            output_path.unlink(missing_ok=True)
             return False
-        logger.debug(f"    步骤 1 成功: 已生成无声视频 {temp_video_path.name}")
-        step1_success = True
+        logger.debug(f"    已生成视频片段 {output_path.name}")
+        return True
     except FileNotFoundError:
         logger.error(f"错误：找不到 FFmpeg 命令 '{ffmpeg_path}'。")
         return False
     except Exception as e:
-        logger.error(f"  创建无声视频时发生未知错误 {temp_video_path.name}: {e}", exc_info=True)
-        if temp_video_path.exists(): temp_video_path.unlink(missing_ok=True)
+        logger.error(f"  创建视频片段时发生未知错误 {output_path.name}: {e}", exc_info=True)
+        output_path.unlink(missing_ok=True)
         return False
+    finally:
+        if canvas_path is not None:
+            canvas_path.unlink(missing_ok=True)
 
-    if step1_success:
-        audio_is_valid = audio_path and audio_path.is_file() and audio_path.stat().st_size > 100
-        if audio_is_valid:
-            logger.debug(f"    步骤 2: 合并视频与音频 {audio_path.name} 到 {output_path.name}")
-            cmd_step2 = [
-                ffmpeg_path, "-y",
-                "-i", str(temp_video_path.resolve()),
-                "-i", str(audio_path.resolve()),
-                "-c:v", "copy",
-                "-c:a", "aac", "-b:a", "128k",
-                "-shortest",
-                str(output_path.resolve())
-            ]
-            try:
-                logger.debug(f"    执行 FFmpeg 命令 (步骤 2 - 合并音视频): {shlex.join(cmd_step2)}")
-                result2 = subprocess.run(cmd_step2, capture_output=True, text=True, check=False, encoding='utf-8', errors='ignore')
-                if result2.returncode != 0:
-                    logger.error(f"  FFmpeg 合并音视频失败: {output_path.name}。返回码: {result2.returncode}")
-                    logger.error(f"  FFmpeg 命令: {shlex.join(cmd_step2)}")
-                    if result2.stdout: logger.error(f"  FFmpeg (step2) STDOUT:\n{result2.stdout}")
-                    if result2.stderr: logger.error(f"  FFmpeg (step2) STDERR:\n{result2.stderr}")
-                    if temp_video_path.exists(): temp_video_path.unlink(missing_ok=True)
-                    if output_path.exists(): output_path.unlink(missing_ok=True)
-                    # task_instance.update_state('PROCESSING', meta={'stage': STAGE_VIDEO_SEGMENTS, 'status': f'Error merging audio for {output_path.name} ({result2.returncode})'})
-                    return False
-                logger.debug(f"    步骤 2 成功: 已合并音视频到 {output_path.name}")
-                if temp_video_path.exists(): temp_video_path.unlink(missing_ok=True)
-                return True
-            except FileNotFoundError:
-                 logger.error(f"错误：找不到 FFmpeg 命令 '{ffmpeg_path}'。")
-                 if temp_video_path.exists(): temp_video_path.unlink(missing_ok=True)
-                 return False
-            except Exception as e:
-                 logger.error(f"  合并音视频时发生未知错误 {output_path.name}: {e}", exc_info=True)
-                 if temp_video_path.exists(): temp_video_path.unlink(missing_ok=True)
-                 if output_path.exists(): output_path.unlink(missing_ok=True)
-                 return False
+
+def create_video_segment_batch(
+    slides: list[tuple[Path, float, Path | None]],
+    output_path: Path,
+    logger: logging.Logger,
+    config: configparser.ConfigParser
+) -> bool:
+    """
+    在一条 FFmpeg 命令中把多张幻灯片编码为一个视频片段 (filter_complex + concat 滤镜)。
+    用于 ffmpeg 命令行路径：N 张幻灯片只启动一个 FFmpeg 进程，而不是 N 个。失败时返回 False。
+
+    Args:
+        slides: [(图片路径, 时长, 音频路径或 None), ...]，按播放顺序排列。
+        output_path: 输出视频路径。
+        logger: 日志记录器实例。
+        config: 配置对象。
+    """
+    ffmpeg_path = get_tool_path("ffmpeg", logger, config)
+    if ffmpeg_path is None:
+        logger.error("FFmpeg 路径未解析，无法创建视频片段。")
+        return False
+
+    target_width = config.getint('Video', 'target_width', fallback=1280)
+    target_fps = config.getint('Video', 'target_fps', fallback=24)
+    scale_pad = f"scale={target_width}:-2:force_original_aspect_ratio=decrease,pad={target_width}:{target_width*9//16}:(ow-iw)/2:(oh-ih)/2,"
+
+    cmd = [ffmpeg_path, "-y"]
+    parts, labels = [], ""
+    input_index = 0
+    canvas_paths = []
+    for i, (image_path, duration, audio_path) in enumerate(slides):
+        # 画布由 Pillow 预先渲染好时跳过 scale/pad 滤镜
+        canvas_path = run_blocking_io(_prerender_slide, image_path, output_path.with_name(f"{output_path.stem}_canvas{i}.bmp"), target_width, logger)
+        if canvas_path is not None:
+            canvas_paths.append(canvas_path)
+        cmd += ["-loop", "1", "-framerate", str(target_fps), "-t", f"{duration:.3f}", "-i", os.path.abspath(canvas_path or image_path)]
+        parts.append(f"[{input_index}:v:0]{'' if canvas_path else scale_pad}format=yuv420p,fps={target_fps},setsar=1[v{i}]")
+        input_index += 1
+        if audio_path is not None and audio_path.is_file() and audio_path.stat().st_size > 100:
+            cmd += ["-i", os.path.abspath(audio_path)]
+            # 音频截断/补齐到与画面相同的时长，保证拼接后每张幻灯片音画对齐
+            parts.append(f"[{input_index}:a:0]atrim=duration={duration:.3f},apad=whole_dur={duration:.3f},asetpts=PTS-STARTPTS[a{i}]")
+            input_index += 1
         else:
-            logger.debug(f"    步骤 2: 无有效音频，直接使用无声视频 {temp_video_path.name} 作为输出 {output_path.name}")
-            try:
-                shutil.move(str(temp_video_path.resolve()), str(output_path.resolve()))
-                return True
-            except Exception as e:
-                 logger.error(f"    重命名/移动无声视频失败: {e}", exc_info=True)
-                 if temp_video_path.exists(): temp_video_path.unlink(missing_ok=True)
-                 if output_path.exists(): output_path.unlink(missing_ok=True)
-                 return False
+            parts.append(f"anullsrc=r=24000:cl=mono,atrim=duration={duration:.3f}[a{i}]")
+        labels += f"[v{i}][a{i}]"
+    parts.append(f"{labels}concat=n={len(slides)}:v=1:a=1[v][a]")
+
+    cmd += [
+        "-filter_complex", ";".join(parts),
+        "-map", "[v]", "-map", "[a]",
+        *_video_encoder_args(ffmpeg_path, config, _segment_preset(config), "23", _segment_threads(config), logger, _segment_x264_options(target_fps)),
+        "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-b:a", "128k",
+        os.path.abspath(output_path),
+    ]
+
+    try:
+        logger.debug("    执行 FFmpeg 命令 (批量生成 %d 张幻灯片的片段): %s", len(slides), LazyShellJoin(cmd))
+        returncode, stderr_tail = run_ffmpeg(cmd)
+        if returncode != 0:
+            logger.error(f"  FFmpeg 批量创建视频片段失败: {output_path.name}。返回码: {returncode}")
+            logger.error(f"  FFmpeg 命令: {shlex.join(cmd)}")
+            if stderr_tail: logger.error(f"  FFmpeg (segment batch) STDERR:\n{stderr_tail}")
+            output_path.unlink(missing_ok=True)
+            return False
+        logger.debug(f"    已生成视频片段 {output_path.name} ({len(slides)} 张幻灯片)")
+        return True
+    except FileNotFoundError:
+        logger.error(f"错误：找不到 FFmpeg 命令 '{ffmpeg_path}'。")
+        return False
+    except Exception as e:
+        logger.error(f"  批量创建视频片段时发生未知错误 {output_path.name}: {e}", exc_info=True)
+        output_path.unlink(missing_ok=True)
+        return False
+    finally:
+        for canvas_path in canvas_paths:
+            canvas_path.unlink(missing_ok=True)
+
+
+def _concat_list_entry(path: Path) -> str:
+    """
+    返回 concat 列表中的一行：绝对路径 (os.path.abspath 不访问文件系统)，单引号按 concat 语法转义。
+    列表从 stdin (pipe:0) 读入，条目需显式带 file: 协议，否则会被解析为相对于 pipe: 的路径。
+    """
+    return "file 'file:" + os.path.abspath(path).replace("'", "'\\''") + "'\n"
+
 
-    return False
+# concat 列表通过 stdin 传给 FFmpeg，不在磁盘上写列表文件；
+# 加大输入线程的包队列，避免新版 FFmpeg (多线程解复用) 在流复制拼接时频繁等待
+CONCAT_STDIN_INPUT = ["-f", "concat", "-safe", "0", "-protocol_whitelist", "file,pipe", "-thread_queue_size", "1024", "-i", "pipe:0"]
+
+
+def _concat_list_bytes(file_paths: list[Path]) -> bytes:
+    """
+    为 FFmpeg concat demuxer 生成文件列表内容。
+    调用方只传入已成功生成的文件，这里不再逐个 stat 检查。
+    """
+    return "".join(_concat_list_entry(p) for p in file_paths).encode('utf-8')
+
+
+# --- 拼接前的格式一致性检查 ---
+# concat demuxer 要求各片段的流结构和编码参数完全一致，否则会静默输出错误的结果
+# (例如某张幻灯片没有音频时，之后的音频整体提前、音画不同步)。不一致时改用 concat 滤镜重新编码。
+def _probe_stream_layout(path: Path, ffprobe_path: str) -> tuple[tuple, float] | None:
+    """返回 (各流的编码参数, 时长)，探测失败返回 None。"""
+    command = [
+        ffprobe_path, "-v", "error",
+        "-show_entries", "stream=codec_type,codec_name,sample_rate,channels,width,height,pix_fmt:format=duration",
+        "-of", "json", str(path),
+    ]
+    result = subprocess.run(command, capture_output=True, text=True, check=False, encoding='utf-8', errors='ignore', timeout=30)
+    if result.returncode != 0:
+        return None
+    info = json.loads(result.stdout or "{}")
+    streams = tuple(
+        (st.get('codec_type'), st.get('codec_name'), st.get('sample_rate'), st.get('channels'), st.get('width'), st.get('height'), st.get('pix_fmt'))
+        for st in info.get('streams', [])
+    )
+    return streams, float(info.get('format', {}).get('duration') or 0.0)
+
+
+def _probe_concat_inputs(file_paths: list[Path], logger: logging.Logger, config: configparser.ConfigParser) -> list[tuple[tuple, float]] | None:
+    """并行探测所有待拼接文件。ffprobe 不可用或任一文件探测失败时返回 None (按格式一致处理)。"""
+    ffprobe_path = get_tool_path("ffprobe", logger, config)
+    if ffprobe_path is None:
+        return None
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(8, len(file_paths)), thread_name_prefix="probe") as executor:
+            layouts = list(executor.map(lambda p: _probe_stream_layout(p, ffprobe_path), file_paths))
+    except (OSError, ValueError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"探测待拼接片段格式失败: {e}，按格式一致处理。")
+        return None
+    return None if any(layout is None for layout in layouts) else layouts
+
+
+def _concat_inputs_uniform(layouts: list[tuple[tuple, float]] | None) -> bool:
+    return layouts is None or len({streams for streams, _duration in layouts}) <= 1
+
+
+def _concat_filter_graph(layouts: list[tuple[tuple, float]]) -> tuple[str, bool]:
+    """
+    为格式不一致的片段构建 concat 滤镜图，输出 [cv] (以及有音频时的 [ca])。
+    没有音频的片段补上等长的静音，分辨率按第一个片段统一。
+
+    Returns:
+        (filter_complex 字符串, 是否有音频输出)。
+    """
+    video = next((st for streams, _ in layouts for st in streams if st[0] == 'video'), None)
+    audio = next((st for streams, _ in layouts for st in streams if st[0] == 'audio'), None)
+    width, height = (video[4], video[5]) if video else (None, None)
+    if audio:
+        sample_rate = audio[2] or "24000"
+        channel_layout = "mono" if audio[3] == 1 else "stereo"
+
+    parts, labels = [], ""
+    for i, (streams, duration) in enumerate(layouts):
+        scale = f"scale={width}:{height}," if width and height else ""
+        parts.append(f"[{i}:v:0]{scale}setsar=1,format=yuv420p[v{i}]")
+        labels += f"[v{i}]"
+        if audio:
+            if any(st[0] == 'audio' for st in streams):
+                parts.append(f"[{i}:a:0]aresample={sample_rate},aformat=channel_layouts={channel_layout}[a{i}]")
+            else:
+                parts.append(f"anullsrc=r={sample_rate}:cl={channel_layout},atrim=duration={duration:.3f}[a{i}]")
+            labels += f"[a{i}]"
+    parts.append(f"{labels}concat=n={len(layouts)}:v=1:a={1 if audio else 0}[cv]" + ("[ca]" if audio else ""))
+    return ";".join(parts), audio is not None
 
 
 def concatenate_videos(video_file_paths: list[Path], output_path: Path, logger: logging.Logger, config: configparser.ConfigParser, task_instance) -> bool:
@@ -402,42 +1007,36 @@ def concatenate_videos(video_file_paths: list[Path], output_path: Path, logger:
         task_instance.update_state('PROCESSING', meta={'stage': STAGE_VIDEO_CONCAT, 'status': 'Error: ffmpeg not found'})
         return False
 
-    concat_list_file = output_path.parent / f"concat_list_{uuid.uuid4().hex[:4]}.txt"
     try:
-        with open(concat_list_file, 'w', encoding='utf-8') as f:
+        concat_list = _concat_list_bytes(video_file_paths)
+        layouts = _probe_concat_inputs(video_file_paths, logger, config)
+        if _concat_inputs_uniform(layouts):
+            cmd_list = [
+                ffmpeg_path, "-y",
+                *CONCAT_STDIN_INPUT,
+                "-c", "copy", # 直接复制代码流（包括视频和音频），速度快
+                os.path.abspath(output_path)
+            ]
+        else:
+            logger.warning("待拼接片段的格式不一致，改用 concat 滤镜重新编码拼接。")
+            graph, has_audio = _concat_filter_graph(layouts)
+            cmd_list = [ffmpeg_path, "-y"]
             for video_file in video_file_paths:
-                 if video_file.is_file():
-                    safe_path = str(video_file.resolve()).replace("'", "'\\''")
-                    f.write(f"file '{safe_path}'\n")
-                 else:
-                     logger.warning(f"要拼接的视频文件不存在，已跳过: {video_file}")
-        if concat_list_file.stat().st_size == 0:
-             logger.error("生成的拼接列表文件为空，没有有效视频可拼接。")
-             concat_list_file.unlink(missing_ok=True)
-             task_instance.update_state('PROCESSING', meta={'stage': STAGE_VIDEO_CONCAT, 'status': 'Error: Concat list empty'})
-             return False
-
-        logger.debug(f"创建了拼接列表文件: {concat_list_file.name}")
-
-        cmd_list = [
-            ffmpeg_path, "-y",
-            "-f", "concat",
-            "-safe", "0",
-            "-i", str(concat_list_file.resolve()),
-            "-c", "copy", # 直接复制代码流（包括视频和音频），速度快
-            str(output_path.resolve())
-        ]
-        logger.debug(f"  执行 FFmpeg 命令: {shlex.join(cmd_list)}")
+                cmd_list += ["-i", os.path.abspath(video_file)]
+            cmd_list += ["-filter_complex", graph, "-map", "[cv]"]
+            if has_audio:
+                cmd_list += ["-map", "[ca]", "-c:a", "aac", "-b:a", "128k"]
+            cmd_list += [*_video_encoder_args(ffmpeg_path, config, "veryfast", "23", 0, logger), "-pix_fmt", "yuv420p", os.path.abspath(output_path)]
+        logger.debug("  执行 FFmpeg 命令: %s", LazyShellJoin(cmd_list))
         task_instance.update_state('PROCESSING', meta={'stage': STAGE_VIDEO_CONCAT, 'progress': 60, 'status': 'Running FFmpeg concat'})
-        result = subprocess.run(cmd_list, capture_output=True, text=True, check=False, encoding='utf-8', errors='ignore')
+        returncode, stderr_tail = run_ffmpeg(cmd_list, concat_list if "pipe:0" in cmd_list else None)
 
-        if result.returncode != 0:
-            logger.error(f"FFmpeg 拼接视频失败。返回码: {result.returncode}")
+        if returncode != 0:
+            logger.error(f"FFmpeg 拼接视频失败。返回码: {returncode}")
             logger.error(f"FFmpeg 命令: {shlex.join(cmd_list)}")
-            if result.stdout: logger.error(f"  FFmpeg (concat) STDOUT:\n{result.stdout}")
-            if result.stderr: logger.error(f"  FFmpeg (concat) STDERR:\n{result.stderr}")
-            if output_path.exists(): output_path.unlink(missing_ok=True)
-            task_instance.update_state('PROCESSING', meta={'stage': STAGE_VIDEO_CONCAT, 'status': 'Error: FFmpeg concat failed', 'ffmpeg_stderr': result.stderr})
+            if stderr_tail: logger.error(f"  FFmpeg (concat) STDERR:\n{stderr_tail}")
+            output_path.unlink(missing_ok=True)
+            task_instance.update_state('PROCESSING', meta={'stage': STAGE_VIDEO_CONCAT, 'status': 'Error: FFmpeg concat failed', 'ffmpeg_stderr': stderr_tail})
             return False
 
         logger.debug(f"视频拼接成功: {output_path.name}")
@@ -449,41 +1048,87 @@ def concatenate_videos(video_file_paths: list[Path], output_path: Path, logger:
          task_instance.update_state('PROCESSING', meta={'stage': STAGE_VIDEO_CONCAT, 'status': 'Error: ffmpeg not found'})
          return False
     except Exception as e:
-         logger.error(f"创建拼接列表或执行拼接时发生错误: {e}", exc_info=True)
-         if output_path.exists(): output_path.unlink(missing_ok=True)
+         logger.error(f"执行拼接时发生错误: {e}", exc_info=True)
+         output_path.unlink(missing_ok=True)
          return False
-    finally:
-         if concat_list_file.exists():
-             try: concat_list_file.unlink()
-             except OSError: pass
 
 
-def add_subtitles(input_video: Path, srt_file: Path, output_video: Path, logger: logging.Logger, config: configparser.ConfigParser, task_instance) -> bool:
+# --- SRT -> ASS 预转换 ---
+# 直接生成带 Default 样式的 ASS 文件交给 ass 滤镜渲染，省去 subtitles 滤镜中 SRT 解码和 force_style 的解析。
+# 文件头与默认样式和 FFmpeg 将 SRT 转为 ASS 时生成的一致 (PlayRes 384x288)，因此 force_style 中的字号等数值含义不变。
+ASS_STYLE_FIELDS = (
+    "Name", "Fontname", "Fontsize", "PrimaryColour", "SecondaryColour", "OutlineColour", "BackColour",
+    "Bold", "Italic", "Underline", "StrikeOut", "ScaleX", "ScaleY", "Spacing", "Angle",
+    "BorderStyle", "Outline", "Shadow", "Alignment", "MarginL", "MarginR", "MarginV", "Encoding",
+)
+ASS_DEFAULT_STYLE = {
+    "Name": "Default", "Fontname": "Arial", "Fontsize": "16", "PrimaryColour": "&Hffffff", "SecondaryColour": "&Hffffff",
+    "OutlineColour": "&H0", "BackColour": "&H0", "Bold": "0", "Italic": "0", "Underline": "0", "StrikeOut": "0",
+    "ScaleX": "100", "ScaleY": "100", "Spacing": "0", "Angle": "0", "BorderStyle": "1", "Outline": "1", "Shadow": "0",
+    "Alignment": "2", "MarginL": "10", "MarginR": "10", "MarginV": "10", "Encoding": "0",
+}
+ASS_HEADER = (
+    "[Script Info]\n"
+    "ScriptType: v4.00+\n"
+    "PlayResX: 384\n"
+    "PlayResY: 288\n"
+    "ScaledBorderAndShadow: yes\n"
+    "\n"
+    "[V4+ Styles]\n"
+    f"Format: {', '.join(ASS_STYLE_FIELDS)}\n"
+)
+_SRT_TIME_RE = re.compile(r"(\d+):(\d{2}):(\d{2})[,.](\d{3})\s*-->\s*(\d+):(\d{2}):(\d{2})[,.](\d{3})")
+
+
+def _ass_time(h: str, m: str, sec: str, ms: str) -> str:
+    return f"{int(h)}:{m}:{sec}.{int(ms) // 10:02d}"
+
+
+def _srt_to_ass(srt_file: Path, ass_file: Path, style_str: str) -> bool:
     """
-    使用 FFmpeg 将 SRT 字幕硬编码到视频中。失败时返回 False。
+    将 SRT 转换为带样式的 ASS 文件。style_str 为 force_style 格式 ("Key=Value,...")，键名不区分大小写。
+
+    Returns:
+        成功写入且至少包含一条字幕时返回 True。
     """
-    logger.debug(f"使用 FFmpeg 添加字幕到视频 '{input_video.name}'...")
-    task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'progress': 90, 'status': 'Starting subtitle embedding'})
+    style = dict(ASS_DEFAULT_STYLE)
+    canonical = {name.lower(): name for name in ASS_STYLE_FIELDS}
+    for item in style_str.split(','):
+        key, sep, value = item.partition('=')
+        field = canonical.get(key.strip().lower())
+        if sep and field and field != "Name":
+            style[field] = value.strip()
+
+    events = []
+    for block in re.split(r"\n\s*\n", srt_file.read_text(encoding='utf-8-sig').replace("\r\n", "\n")):
+        lines = block.strip().split("\n")
+        for idx, line in enumerate(lines):
+            match = _SRT_TIME_RE.search(line)
+            if match:
+                text = "\\N".join(l.strip() for l in lines[idx + 1:] if l.strip())
+                text = text.replace("{", "｛").replace("}", "｝") # 避免被当作 ASS 覆盖标签
+                if text:
+                    g = match.groups()
+                    events.append(f"Dialogue: 0,{_ass_time(*g[:4])},{_ass_time(*g[4:])},Default,,0,0,0,,{text}\n")
+                break
+    if not events:
+        return False
 
+    content = (
+        ASS_HEADER
+        + "Style: " + ",".join(style[name] for name in ASS_STYLE_FIELDS) + "\n\n"
+        + "[Events]\nFormat: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+        + "".join(events)
+    )
+    ass_file.write_bytes(content.encode('utf-8'))
+    return True
 
-    ffmpeg_path = get_tool_path("ffmpeg", logger, config)
-    if ffmpeg_path is None:
-         logger.error("FFmpeg 路径未解析，无法添加字幕。")
-         task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'status': 'Error: ffmpeg not found'})
-         return False
-    if not input_video.is_file():
-         logger.error(f"输入视频文件不存在: {input_video}")
-         task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'status': 'Error: Input video not found'})
-         return False
-    if not srt_file.is_file():
-         logger.error(f"字幕文件不存在: {srt_file}")
-         task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'status': 'Error: SRT file not found'})
-         return False
-    if srt_file.stat().st_size == 0:
-        logger.warning(f"字幕文件为空: {srt_file}")
-        task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'status': 'Warning: SRT file empty'})
-        return False # SRT 文件为空也视为失败
 
+def _subtitle_filter(srt_file: Path, logger: logging.Logger, config: configparser.ConfigParser) -> str:
+    """
+    构建烧录字幕用的 -vf 滤镜参数。优先把 SRT 预转换为带样式的 ASS 文件并使用 ass 滤镜，
+    转换失败时使用 subtitles 滤镜 + config.ini 中的 force_style 样式。
+    """
     # 从 config.ini 读取字幕样式
     ffmpeg_style_str = config.get(
         'Video',
@@ -492,63 +1137,98 @@ def add_subtitles(input_video: Path, srt_file: Path, output_video: Path, logger:
     )
     logger.debug(f"使用的字幕样式 (force_style): {ffmpeg_style_str}")
 
-    # --- 构建正确的 filtergraph 字符串 ---
+    ass_file = srt_file.with_suffix(".ass")
+    try:
+        if _srt_to_ass(srt_file, ass_file, ffmpeg_style_str):
+            # 在 filtergraph 字符串内部，单引号需要 \' 转义
+            ass_path_escaped = os.path.abspath(ass_file).replace("'", r"\'")
+            logger.debug(f"已将字幕预转换为 ASS: {ass_file.name}")
+            return f"ass=filename='{ass_path_escaped}'"
+        logger.warning("SRT 中没有可转换的字幕条目，使用 subtitles 滤镜。")
+    except (OSError, UnicodeDecodeError) as e:
+        logger.warning(f"SRT 转换为 ASS 失败: {e}，使用 subtitles 滤镜。")
+
+    # --- 回退: subtitles 滤镜 ---
     # SRT 文件路径需要正确引用给 libass
-    srt_path_str = str(srt_file.resolve())
+    srt_path_str = os.path.abspath(srt_file)
     # 在 filtergraph 字符串内部，单引号需要 \' 转义
     filter_srt_path_escaped = srt_path_str.replace("'", r"\'")
 
     # 将样式字符串内部的单引号也转义
     styles_escaped = ffmpeg_style_str.replace("'", r"\'")
 
-    # --- 构建正确的 filtergraph 字符串 ---
     # 使用 subtitles 滤镜，filename 选项和 force_style 选项
-    # 格式: subtitles=filename='...',force_style='...'
-    # **选项之间用冒号 : 分隔**
-    # 每个选项的值用单引号包裹，内部单引号用 \' 转义
+    # 格式: subtitles=filename='...':force_style='...'
+    # **选项之间用冒号 : 分隔**，每个选项的值用单引号包裹，内部单引号用 \' 转义
+    filter_options = f"filename='{filter_srt_path_escaped}':force_style='{styles_escaped}'"
+    return f"subtitles={filter_options}"
 
-    # 构造滤镜选项字符串
-    # 核心： filename='...',force_style='...'
-    filter_options = f"filename='{filter_srt_path_escaped}':force_style='{styles_escaped}'" # <--- 关键：选项之间用冒号 :
 
-    # 完整的 -vf 参数值就是 "subtitles=filename='...':force_style='...'"
-    # 将滤镜名称和参数用等号连接
-    vf_param_value = f"subtitles={filter_options}"
+def _subtitle_encode_args(ffmpeg_path: str, config: configparser.ConfigParser, logger: logging.Logger) -> list[str]:
+    """
+    烧录字幕时整段视频编码的参数。这是流程中最长的一次编码：有可用的硬件编码器时优先使用，
+    否则使用 libx264 veryfast 预设，并用 -threads 0 按 CPU 核数自动多线程。预设和 CRF 可在 [Video] 中调整。
+    """
+    return _video_encoder_args(
+        ffmpeg_path, config,
+        config.get('Video', 'subtitle_preset', fallback='veryfast'),
+        config.get('Video', 'subtitle_crf', fallback='23'),
+        0, logger,
+    )
+
+
+def add_subtitles(input_video: Path, srt_file: Path, output_video: Path, logger: logging.Logger, config: configparser.ConfigParser, task_instance) -> bool:
+    """
+    使用 FFmpeg 将 SRT 字幕硬编码到视频中。失败时返回 False。
+    """
+    logger.debug(f"使用 FFmpeg 添加字幕到视频 '{input_video.name}'...")
+    task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'progress': 90, 'status': 'Starting subtitle embedding'})
 
 
-    # **或者尝试 ass 滤镜，语法类似，有时更稳定**
-    # filter_name_ass = "ass"
-    # filter_options_ass = f"filename='{filter_srt_path_escaped}':force_style='{styles_escaped}'"
-    # vf_param_value = f"{filter_name_ass}={filter_options_ass}"
+    ffmpeg_path = get_tool_path("ffmpeg", logger, config)
+    if ffmpeg_path is None:
+         logger.error("FFmpeg 路径未解析，无法添加字幕。")
+         task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'status': 'Error: ffmpeg not found'})
+         return False
+    if not input_video.is_file():
+         logger.error(f"输入视频文件不存在: {input_video}")
+         task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'status': 'Error: Input video not found'})
+         return False
+    if not srt_file.is_file():
+         logger.error(f"字幕文件不存在: {srt_file}")
+         task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'status': 'Error: SRT file not found'})
+         return False
+    if srt_file.stat().st_size == 0:
+        logger.warning(f"字幕文件为空: {srt_file}")
+        task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'status': 'Warning: SRT file empty'})
+        return False # SRT 文件为空也视为失败
 
+    vf_param_value = _subtitle_filter(srt_file, logger, config)
 
-    input_video_str = str(input_video.resolve())
-    output_video_str = str(output_video.resolve())
+    input_video_str = os.path.abspath(input_video)
+    output_video_str = os.path.abspath(output_video)
 
     # --- 构建 FFmpeg 命令 ---
     cmd_list = [
         ffmpeg_path, "-y", # 覆盖输出文件
         "-i", input_video_str, # 输入视频
         "-vf", vf_param_value, # <--- 使用构建好的滤镜参数字符串
-        "-c:v", "libx264", # 视频编码器
-        "-preset", "medium", # 编码速度
-        "-crf", "22", # 质量因子
+        *_subtitle_encode_args(ffmpeg_path, config, logger), # 视频编码器、速度与质量
         "-c:a", "copy", # 直接复制音频流
-        str(output_video.resolve()) # 输出文件
+        output_video_str # 输出文件
     ]
     try:
-        logger.debug(f"  执行 FFmpeg 命令 (添加字幕): {shlex.join(cmd_list)}")
+        logger.debug("  执行 FFmpeg 命令 (添加字幕): %s", LazyShellJoin(cmd_list))
         task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'progress': 92, 'status': 'Running FFmpeg subtitles'})
 
-        result = subprocess.run(cmd_list, capture_output=True, text=True, check=False, encoding='utf-8', errors='ignore')
+        returncode, stderr_tail = run_ffmpeg(cmd_list)
 
-        if result.returncode != 0:
-            logger.error(f"FFmpeg 添加字幕失败。返回码: {result.returncode}")
+        if returncode != 0:
+            logger.error(f"FFmpeg 添加字幕失败。返回码: {returncode}")
             logger.error(f"FFmpeg 命令: {shlex.join(cmd_list)}")
-            if result.stdout: logger.error(f"  FFmpeg (subtitles) STDOUT:\n{result.stdout}")
-            if result.stderr: logger.error(f"  FFmpeg (subtitles) STDERR:\n{result.stderr}")
-            if output_video.exists(): output_video.unlink(missing_ok=True)
-            task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'status': 'Error: FFmpeg subtitles failed', 'ffmpeg_stderr': result.stderr})
+            if stderr_tail: logger.error(f"  FFmpeg (subtitles) STDERR:\n{stderr_tail}")
+            output_video.unlink(missing_ok=True)
+            task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'status': 'Error: FFmpeg subtitles failed', 'ffmpeg_stderr': stderr_tail})
             return False # 添加字幕失败
 
         logger.debug(f"字幕添加成功: {output_video.name}")
@@ -561,11 +1241,161 @@ def add_subtitles(input_video: Path, srt_file: Path, output_video: Path, logger:
          return False
     except Exception as e:
          logger.error(f"添加字幕时发生未知错误: {e}", exc_info=True)
-         if output_video.exists(): output_video.unlink(missing_ok=True)
+         output_video.unlink(missing_ok=True)
+         task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'status': f'Error: Adding subtitles failed ({type(e).__name__})'})
+         return False
+
+
+def concatenate_videos_with_subtitles(
+    video_file_paths: list[Path],
+    srt_file: Path,
+    output_video: Path,
+    logger: logging.Logger,
+    config: configparser.ConfigParser,
+    task_instance
+) -> bool:
+    """
+    拼接视频片段并烧录字幕，只做一次编码：concat demuxer 输出的连续视频流直接经过 subtitles 滤镜编码，
+    不再先流复制拼接出中间视频、再对整段视频重新编码。失败时返回 False。
+    """
+    logger.debug(f"使用 FFmpeg 拼接视频 ({len(video_file_paths)} 段) 并添加字幕...")
+
+    ffmpeg_path = get_tool_path("ffmpeg", logger, config)
+    if ffmpeg_path is None:
+         logger.error("FFmpeg 路径未解析，无法拼接视频并添加字幕。")
+         task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'status': 'Error: ffmpeg not found'})
+         return False
+    if not video_file_paths:
+        logger.warning("要拼接的视频列表为空。")
+        return False
+    if not srt_file.is_file() or srt_file.stat().st_size == 0:
+         logger.error(f"字幕文件不存在或为空: {srt_file}")
+         task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'status': 'Error: SRT file not found'})
+         return False
+
+    try:
+        concat_list = _concat_list_bytes(video_file_paths)
+        layouts = _probe_concat_inputs(video_file_paths, logger, config)
+        if _concat_inputs_uniform(layouts):
+            cmd_list = [
+                ffmpeg_path, "-y",
+                *CONCAT_STDIN_INPUT,
+                "-vf", _subtitle_filter(srt_file, logger, config),
+                *_subtitle_encode_args(ffmpeg_path, config, logger),
+                "-c:a", "copy", # 各片段音频格式一致，直接复制
+                os.path.abspath(output_video)
+            ]
+        else:
+            # 片段格式不一致 (例如部分幻灯片没有音频)：concat 滤镜拼接后接字幕滤镜，仍然只编码一次
+            logger.warning("待拼接片段的格式不一致，改用 concat 滤镜拼接并添加字幕。")
+            graph, has_audio = _concat_filter_graph(layouts)
+            cmd_list = [ffmpeg_path, "-y"]
+            for video_file in video_file_paths:
+                cmd_list += ["-i", os.path.abspath(video_file)]
+            cmd_list += ["-filter_complex", f"{graph};[cv]{_subtitle_filter(srt_file, logger, config)}[sv]", "-map", "[sv]"]
+            if has_audio:
+                cmd_list += ["-map", "[ca]", "-c:a", "aac", "-b:a", "128k"]
+            cmd_list += [*_subtitle_encode_args(ffmpeg_path, config, logger), "-pix_fmt", "yuv420p", os.path.abspath(output_video)]
+        logger.debug("  执行 FFmpeg 命令 (拼接 + 添加字幕): %s", LazyShellJoin(cmd_list))
+        task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'progress': 75, 'status': 'Running FFmpeg concat + subtitles'})
+        returncode, stderr_tail = run_ffmpeg(cmd_list, concat_list if "pipe:0" in cmd_list else None)
+
+        if returncode != 0:
+            logger.error(f"FFmpeg 拼接并添加字幕失败。返回码: {returncode}")
+            logger.error(f"FFmpeg 命令: {shlex.join(cmd_list)}")
+            if stderr_tail: logger.error(f"  FFmpeg (concat+subtitles) STDERR:\n{stderr_tail}")
+            output_video.unlink(missing_ok=True)
+            task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'status': 'Error: FFmpeg subtitles failed', 'ffmpeg_stderr': stderr_tail})
+            return False
+
+        logger.debug(f"拼接并添加字幕成功: {output_video.name}")
+        return True
+
+    except FileNotFoundError:
+         logger.error(f"错误：找不到 FFmpeg 命令 '{ffmpeg_path}'。")
+         task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'status': 'Error: ffmpeg not found'})
+         return False
+    except Exception as e:
+         logger.error(f"拼接视频并添加字幕时发生未知错误: {e}", exc_info=True)
+         output_video.unlink(missing_ok=True)
          task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'status': f'Error: Adding subtitles failed ({type(e).__name__})'})
          return False
 
 
+# --- 后台字幕识别 ---
+class _BackgroundTaskState:
+    """
+    传给后台线程中 generate_subtitles 的任务实例替身。
+    ASR 与片段生成同时进行，如果两边都上报进度，前端看到的阶段和进度会来回跳动；
+    因此后台线程只记录调试日志，由主线程在取得结果后统一上报。
+    """
+
+    def __init__(self, logger: logging.Logger):
+        self._logger = logger
+
+    def update_state(self, state=None, meta=None):
+        status = (meta or {}).get('status')
+        if status:
+            self._logger.debug(f"[后台 ASR] {status}")
+
+
+def _segment_content_key(image_path: Path, audio_path: Path | None, clip_duration: float) -> bytes:
+    """
+    计算幻灯片片段的内容键：图片、音频的字节内容和片段时长都相同的幻灯片会编码出完全相同的片段。
+    使用 BLAKE2 (比 SHA-256 快，这里只用于去重而非安全用途)。
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{clip_duration:.3f}".encode('ascii'))
+    for path in (image_path, audio_path):
+        h.update(b"\0")
+        if path is None:
+            continue
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+    return h.digest()
+
+
+def _wait_background_asr(asr_future: concurrent.futures.Future | None, logger: logging.Logger):
+    """合成结束 (包括提前失败或抛出异常) 时，取消尚未开始的 ASR 或等待其结束，避免它在临时目录被清理后继续读写文件。"""
+    if asr_future is None or asr_future.cancel():
+        return
+    logger.debug("等待后台字幕识别结束...")
+    concurrent.futures.wait([asr_future])
+
+
+def _fast_move(src: Path, dst: Path):
+    """
+    移动文件：同一文件系统上用 os.replace 原子重命名 (不复制数据)，仅在跨文件系统 (EXDEV) 时回退到 shutil.move。
+    """
+    src_s, dst_s = os.fspath(src), os.fspath(dst) # 转换一次，重命名和回退路径共用
+    try:
+        os.replace(src_s, dst_s)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(src_s, dst_s)
+
+
+def _publish_final_video(partial_video_path: Path, final_video_path: Path, subtitle_file_path: Path, logger: logging.Logger) -> bool:
+    """
+    将输出目录中写好的临时视频重命名为最终文件，并清理字幕文件。两个输出分支 (带字幕/无字幕) 共用。
+
+    Returns:
+        成功返回 True；移动失败时删除临时视频并返回 False。
+    """
+    try:
+        # 跨文件系统时移动会退化为整份复制；gevent worker 中放到系统线程执行，不阻塞其他任务
+        run_blocking_io(_fast_move, partial_video_path, final_video_path)
+    except OSError as e:
+        # 移动失败 (磁盘满、权限等) 属于预期内的错误，只在 DEBUG 级别下附带完整堆栈
+        logger.error(f"移动最终视频时出错: {type(e).__name__}: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
+        partial_video_path.unlink(missing_ok=True)
+        return False
+    subtitle_file_path.unlink(missing_ok=True)
+    return True
+
+
 # --- 视频合成主函数 (由 Celery 任务调用) ---
 def synthesize_video_for_task(
     processed_data: list[dict],
@@ -613,189 +1443,248 @@ def synthesize_video_for_task(
     default_slide_duration = config.getfloat('Video', 'default_slide_duration', fallback=3.0)
     num_slides_to_process = len(processed_data)
 
-    # --- 1. 生成各幻灯片的视频片段 ---
-    task_instance.update_state('PROCESSING', meta={'stage': STAGE_VIDEO_SEGMENTS, 'progress': 52, 'status': 'Creating segments'}) # 更新阶段和起始进度
-    logger.info(f"步骤 1/3: 使用 FFmpeg 生成各幻灯片的视频片段 ({num_slides_to_process} 个)")
-    for i, data in enumerate(processed_data):
-        slide_num = data.get('slide_number', i + 1)
-        image_path_str = data.get('image_path')
-        audio_path_str = data.get('audio_path')
-        audio_duration = data.get('audio_duration', 0.0)
-
-        if not image_path_str or not Path(image_path_str).is_file():
-            logger.warning(f"幻灯片 {slide_num}: 图片路径无效或文件不存在 '{image_path_str}'。跳过此片段。")
-            continue
-
-        image_path = Path(image_path_str)
-        audio_path = Path(audio_path_str) if audio_path_str and Path(audio_path_str).is_file() else None
-
-        clip_duration = audio_duration if audio_duration is not None and audio_duration > 0.01 else default_slide_duration
-
-        segment_output_path = temp_segments_dir / f"segment_{slide_num}_{uuid.uuid4().hex[:4]}.mp4"
-
-        success = create_video_segment(
-            image_path,
-            clip_duration,
-            audio_path if audio_duration is not None and audio_duration > 0.01 else None,
-            segment_output_path,
+    # --- 字幕识别 (ASR) 在后台线程中与片段生成同时进行 ---
+    # ASR 只依赖音频文件，和 FFmpeg 片段编码互不依赖；总耗时约为 max(ASR, 编码) 而不是两者之和。
+    audio_paths_for_asr = [d.get('audio_path') for d in processed_data if d.get('audio_path') and d.get('audio_duration', 0) > 0.01]
+    subtitle_file_path = temp_run_dir / "subtitles.srt" # <--- 使用固定文件名
+    asr_future = None
+    if audio_paths_for_asr:
+        logger.info(f"发现 {len(audio_paths_for_asr)} 个有效音频片段用于 ASR，在后台开始字幕识别。")
+        # gevent worker 中执行器线程只是 greenlet，CPU 密集的识别会阻塞 hub (连带进程内的其他任务)，
+        # 因此经 run_blocking_io 放到系统线程中执行；其他情况下直接在执行器线程中运行
+        asr_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="asr")
+        asr_future = asr_executor.submit(
+            run_blocking_io,
+            generate_subtitles,
+            audio_paths_for_asr,
+            subtitle_file_path,
+            temp_run_dir, # 传递临时目录
             logger,
             config,
-            task_instance # <--- 传递任务实例
+            _BackgroundTaskState(logger)
         )
-        if success:
-            segment_files.append(segment_output_path)
-            progress = 52 + int((i + 1) / num_slides_to_process * 15) # 52% 到 67% 用于片段生成
-            task_instance.update_state('PROCESSING', meta={'stage': STAGE_VIDEO_SEGMENTS, 'progress': progress, 'current_slide': slide_num})
-        else:
-            logger.error(f"未能创建幻灯片 {slide_num} 的视频片段。合成中止。")
-            task_instance.update_state('PROCESSING', meta={'stage': STAGE_VIDEO_SEGMENTS, 'status': f'Error creating segment for slide {slide_num}'})
-            return False # 任一片段失败，整个合成失败
-
-
-    if not segment_files:
-        logger.error("未能成功生成任何视频片段。")
-        task_instance.update_state('PROCESSING', meta={'stage': STAGE_VIDEO_SEGMENTS, 'status': 'Error: No segments created'})
-        return False
+        asr_executor.shutdown(wait=False) # 不再提交新任务，线程在识别完成后退出
 
-    task_instance.update_state('PROCESSING', meta={'stage': STAGE_VIDEO_SEGMENTS, 'progress': 67, 'status': 'Segments created'})
+    # 之后的任何返回或异常都先等待后台 ASR 结束，避免它在 tasks.py 清理临时目录后继续读写文件
+    try:
+        # --- 1. 生成各幻灯片的视频片段 ---
+        task_instance.update_state('PROCESSING', meta={'stage': STAGE_VIDEO_SEGMENTS, 'progress': 52, 'status': 'Creating segments'}) # 更新阶段和起始进度
+        logger.info(f"步骤 1/3: 使用 FFmpeg 生成各幻灯片的视频片段 ({num_slides_to_process} 个)")
+        # 先整理每个片段的参数，再并行执行 FFmpeg 编码 (每个片段是独立的子进程)
+        segment_jobs = [] # (slide_num, image_path, clip_duration, audio_path | None, output_path)
+        for i, data in enumerate(processed_data):
+            slide_num = data.get('slide_number', i + 1)
+            image_path_str = data.get('image_path')
+            audio_path_str = data.get('audio_path')
+            audio_duration = data.get('audio_duration', 0.0)
+
+            if not image_path_str or not Path(image_path_str).is_file():
+                logger.warning(f"幻灯片 {slide_num}: 图片路径无效或文件不存在 '{image_path_str}'。跳过此片段。")
+                continue
+
+            image_path = Path(image_path_str)
+            audio_path = Path(audio_path_str) if audio_path_str and Path(audio_path_str).is_file() else None
+
+            clip_duration = audio_duration if audio_duration is not None and audio_duration > 0.01 else default_slide_duration
+
+            segment_output_path = temp_segments_dir / f"segment_{slide_num}.mp4" # 幻灯片编号在任务内唯一
+            segment_jobs.append((
+                slide_num,
+                image_path,
+                clip_duration,
+                audio_path if audio_duration is not None and audio_duration > 0.01 else None,
+                segment_output_path
+            ))
+
+        # ffmpeg 命令行路径下，把相邻的幻灯片分批交给同一个 FFmpeg 进程编码，减少进程启动次数；
+        # PyAV 路径在进程内编码，没有这部分开销，保持逐张生成。
+        use_pyav = PYAV_AVAILABLE and PILLOW_AVAILABLE and config.getboolean('Video', 'use_pyav', fallback=True)
+        batch_size = 1 if use_pyav else max(1, config.getint('Video', 'segment_batch_size', fallback=8))
+
+        # 逐张生成时，内容完全相同的幻灯片 (如重复的章节过渡页) 只编码一次，
+        # concat 列表中直接重复引用同一个片段文件
+        duplicate_of = {} # slide_num -> 首个相同片段的输出路径
+        encode_jobs = segment_jobs
+        if batch_size == 1 and len(segment_jobs) > 1:
+            first_by_key = {}
+            encode_jobs = []
+            for job in segment_jobs:
+                slide_num, image_path, clip_duration, audio_path, segment_output_path = job
+                try:
+                    key = _segment_content_key(image_path, audio_path, clip_duration)
+                except OSError as e:
+                    logger.debug(f"幻灯片 {slide_num}: 计算片段内容键失败，照常编码: {e}")
+                    encode_jobs.append(job)
+                    continue
+                if key in first_by_key:
+                    duplicate_of[slide_num] = first_by_key[key]
+                    continue
+                first_by_key[key] = segment_output_path
+                encode_jobs.append(job)
+            if duplicate_of:
+                logger.info(f"{len(duplicate_of)} 张幻灯片与之前的幻灯片内容相同，复用已生成的片段。")
+
+        encode_batches = [encode_jobs[k:k + batch_size] for k in range(0, len(encode_jobs), batch_size)]
+        if batch_size > 1:
+            logger.debug(f"ffmpeg 命令行路径：每 {batch_size} 张幻灯片合并为一个编码任务，共 {len(encode_batches)} 个。")
+
+        encode_parallelism = config.getint('Video', 'encode_parallelism', fallback=max(1, (os.cpu_count() or 2) // _segment_threads(config))) # 总线程数约等于核数
+        encode_parallelism = max(1, min(encode_parallelism, len(encode_batches) or 1))
+        logger.debug(f"并行生成视频片段，并发数: {encode_parallelism}")
+
+        def _batch_output_path(batch) -> Path:
+            return batch[0][4] if batch_size == 1 else temp_segments_dir / f"segment_batch_{batch[0][0]}.mp4"
+
+        def _encode(batch):
+            if batch_size == 1:
+                _, image_path, clip_duration, audio_path, segment_output_path = batch[0]
+                return create_video_segment(image_path, clip_duration, audio_path, segment_output_path, logger, config, task_instance)
+            slides = [(image_path, clip_duration, audio_path) for _, image_path, clip_duration, audio_path, _ in batch]
+            return create_video_segment_batch(slides, _batch_output_path(batch), logger, config)
+
+        failed_slide = None
+        with concurrent.futures.ThreadPoolExecutor(max_workers=encode_parallelism, thread_name_prefix="segment") as executor:
+            futures = {executor.submit(_encode, batch): batch for batch in encode_batches}
+            completed = len(duplicate_of) # 复用的片段无需编码
+            for future in concurrent.futures.as_completed(futures):
+                slide_num = futures[future][0][0]
+                try:
+                    success = future.result()
+                except Exception as e:
+                    logger.error(f"生成幻灯片 {slide_num} 的视频片段时发生错误: {e}", exc_info=True)
+                    success = False
+                if not success:
+                    failed_slide = slide_num
+                    for pending in futures: pending.cancel() # 任一片段失败即中止，取消尚未开始的编码
+                    break
+                completed += len(futures[future])
+                progress = 52 + int(completed / num_slides_to_process * 15) # 52% 到 67% 用于片段生成
+                task_instance.update_state('PROCESSING', meta={'stage': STAGE_VIDEO_SEGMENTS, 'progress': progress, 'current_slide': slide_num})
+
+        if failed_slide is not None:
+            logger.error(f"未能创建幻灯片 {failed_slide} 的视频片段。合成中止。")
+            task_instance.update_state('PROCESSING', meta={'stage': STAGE_VIDEO_SEGMENTS, 'status': f'Error creating segment for slide {failed_slide}'})
+            return False # 任一片段失败，整个合成失败
 
+        if batch_size == 1:
+            segment_files = [duplicate_of.get(job[0], job[4]) for job in segment_jobs] # 保持幻灯片顺序
+        else:
+            segment_files = [_batch_output_path(batch) for batch in encode_batches] # 保持幻灯片顺序
 
-    # --- 2. 拼接视频片段 ---
-    task_instance.update_state('PROCESSING', meta={'stage': STAGE_VIDEO_CONCAT, 'progress': 68, 'status': 'Concatenating segments'})
-    logger.info(f"步骤 2/3: 使用 FFmpeg concat demuxer 拼接视频片段 ({len(segment_files)} 个)")
-    base_video_path = temp_run_dir / f"base_video_no_subs_{uuid.uuid4().hex[:4]}.mp4"
-    success_concat = concatenate_videos(segment_files, base_video_path, logger, config, task_instance)
-    if not success_concat:
-        logger.error("拼接视频片段失败。")
-        task_instance.update_state('PROCESSING', meta={'stage': STAGE_VIDEO_CONCAT, 'status': 'Error: FFmpeg concat failed'})
-        return False
 
-    task_instance.update_state('PROCESSING', meta={'stage': STAGE_VIDEO_CONCAT, 'progress': 70, 'status': 'Concatenation complete'})
+        if not segment_files:
+            logger.error("未能成功生成任何视频片段。")
+            task_instance.update_state('PROCESSING', meta={'stage': STAGE_VIDEO_SEGMENTS, 'status': 'Error: No segments created'})
+            return False
 
+        task_instance.update_state('PROCESSING', meta={'stage': STAGE_VIDEO_SEGMENTS, 'progress': 67, 'status': 'Segments created'})
 
-    # --- 3. 生成字幕 ---
-    task_instance.update_state('PROCESSING', meta={'stage': STAGE_GENERATE_SUBTITLES, 'progress': 72, 'status': 'Generating subtitles (ASR)'})
-    logger.info("步骤 3/3: 生成字幕文件 (ASR) 并添加到视频")
-    audio_paths_for_asr = [d.get('audio_path') for d in processed_data if d.get('audio_path') and d.get('audio_duration', 0) > 0.01]
-    subtitle_file_path = temp_run_dir / "subtitles.srt" # <--- 使用固定文件名
-    subtitles_generated = False
-    asr_errors_occurred = False
 
-    if audio_paths_for_asr:
-        logger.info(f"发现 {len(audio_paths_for_asr)} 个有效音频片段用于 ASR。")
-        try:
-             subtitles_generated = generate_subtitles(
-                audio_paths_for_asr,
-                subtitle_file_path,
-                temp_run_dir, # 传递临时目录
-                logger,
-                config,
-                task_instance # <--- 传递任务实例
-             )
-        except Exception as asr_e:
-             logger.error(f"调用 generate_subtitles 时发生错误: {asr_e}", exc_info=True)
-             asr_errors_occurred = True
-             subtitles_generated = False
+        # --- 2. 等待字幕识别 (ASR) 结果 ---
+        task_instance.update_state('PROCESSING', meta={'stage': STAGE_GENERATE_SUBTITLES, 'progress': 68, 'status': 'Generating subtitles (ASR)'})
+        logger.info("步骤 2/3: 获取字幕文件 (ASR)")
+        subtitles_generated = False
+        asr_errors_occurred = False
 
-    else:
-        logger.info("没有有效时长的音频文件，跳过字幕生成。")
-        task_instance.update_state('PROCESSING', meta={'stage': STAGE_GENERATE_SUBTITLES, 'progress': 100, 'status': 'Skipping ASR (no audio)'})
+        if asr_future is not None:
+            logger.info("等待后台字幕识别完成...")
+            try:
+                 subtitles_generated = asr_future.result()
+            except Exception as asr_e:
+                 logger.error(f"调用 generate_subtitles 时发生错误: {asr_e}", exc_info=True)
+                 asr_errors_occurred = True
+                 subtitles_generated = False
+            status = 'Subtitles generated successfully' if subtitles_generated else 'Error: ASR failed or SRT invalid'
+            task_instance.update_state('PROCESSING', meta={'stage': STAGE_GENERATE_SUBTITLES, 'progress': 70, 'status': status})
 
+        else:
+            logger.info("没有有效时长的音频文件，跳过字幕生成。")
+            task_instance.update_state('PROCESSING', meta={'stage': STAGE_GENERATE_SUBTITLES, 'progress': 70, 'status': 'Skipping ASR (no audio)'})
 
-    # 检查 SRT 文件有效性
-    srt_is_valid = subtitles_generated and subtitle_file_path.exists() and subtitle_file_path.stat().st_size > 5
 
-    # --- 添加字幕 (如果成功生成) ---
-    if srt_is_valid:
-        task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'progress': 90, 'status': 'Adding subtitles'})
-        logger.info("字幕文件有效，尝试添加字幕到视频。")
-        final_video_with_subs_path = final_video_path # 最终输出路径
+        # 检查 SRT 文件有效性
+        srt_is_valid = subtitles_generated and subtitle_file_path.exists() and subtitle_file_path.stat().st_size > 5
 
-        success_sub = add_subtitles(base_video_path, subtitle_file_path, final_video_with_subs_path, logger, config, task_instance) # <--- 传递任务实例
+        # --- 3. 拼接视频片段 (有字幕时在同一次编码中烧录字幕) ---
+        # 先写到输出目录中的临时文件名，完成后再原子重命名为最终文件名：
+        # 同一文件系统上只是一次 rename，且下载方不会读到写了一半的视频。
+        partial_video_path = final_video_path.with_name(f".{final_video_path.stem}.partial{final_video_path.suffix}")
+        if srt_is_valid:
+            task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'progress': 72, 'status': 'Concatenating segments and adding subtitles'})
+            logger.info(f"步骤 3/3: 拼接视频片段 ({len(segment_files)} 个) 并添加字幕 (单次编码)")
 
-        if success_sub:
-            logger.debug(f"字幕添加成功。最终视频已保存到: {final_video_with_subs_path.resolve()}")
-            if base_video_path.exists(): base_video_path.unlink(missing_ok=True)
-            if subtitle_file_path.exists(): subtitle_file_path.unlink(missing_ok=True)
-            task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'progress': 100, 'status': 'Subtitles added successfully'})
-            return True # 整个合成流程成功
+            success_sub = concatenate_videos_with_subtitles(segment_files, subtitle_file_path, partial_video_path, logger, config, task_instance)
+            if success_sub and _publish_final_video(partial_video_path, final_video_path, subtitle_file_path, logger):
+                logger.debug("字幕添加成功。最终视频已保存到: %s", final_video_path)
+                task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'progress': 100, 'status': 'Subtitles added successfully'})
+                return True # 整个合成流程成功
 
-        else:
             logger.error("添加字幕失败。将输出不带字幕的视频。")
             task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'status': 'Error: FFmpeg subtitles failed', 'ffmpeg_stderr': 'Check logs for details'}) # 更新状态
-            # 添加字幕失败，将基础无字幕视频移动到最终输出位置
-            try:
-                 shutil.move(str(base_video_path.resolve()), str(final_video_path.resolve()))
-                 logger.warning(f"最终视频 (无字幕 - 因添加失败) 已保存到: {final_video_path.resolve()}")
-                 if subtitle_file_path.exists(): subtitle_file_path.unlink(missing_ok=True)
-                 task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'progress': 100, 'status': 'Warning: Subtitles failed, saved video without subtitles'})
-                 return True # 视为成功 (有视频输出)
-            except Exception as e:
-                 logger.error(f"移动最终无字幕视频时出错: {e}", exc_info=True)
-                 task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'status': f'Error: Failed to move base video ({type(e).__name__})'})
-                 return False # 移动失败，任务失败
-
-    else:
-        # 如果 SRT 文件无效或生成失败
-        logger.warning("步骤 4: 跳过添加字幕 (字幕文件无效或生成失败)。将输出不带字幕的视频。")
-        if asr_errors_occurred:
-            logger.error("字幕生成过程中发生了错误，请检查日志。")
-            task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'status': 'Error: ASR failed or SRT invalid, skipping subtitles'})
         else:
-            task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'status': 'Skipping subtitles (no valid SRT)'})
-
+            # 如果 SRT 文件无效或生成失败
+            logger.warning("跳过添加字幕 (字幕文件无效或生成失败)。将输出不带字幕的视频。")
+            if asr_errors_occurred:
+                logger.error("字幕生成过程中发生了错误，请检查日志。")
+                task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'status': 'Error: ASR failed or SRT invalid, skipping subtitles'})
+            else:
+                task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'status': 'Skipping subtitles (no valid SRT)'})
+
+        # --- 无字幕 (或添加字幕失败): 流复制拼接，不重新编码 ---
+        task_instance.update_state('PROCESSING', meta={'stage': STAGE_VIDEO_CONCAT, 'progress': 72, 'status': 'Concatenating segments'})
+        logger.info(f"步骤 3/3: 使用 FFmpeg concat demuxer 拼接视频片段 ({len(segment_files)} 个)")
+        success_concat = concatenate_videos(segment_files, partial_video_path, logger, config, task_instance)
+        if not success_concat or not partial_video_path.exists():
+            logger.error("拼接视频片段失败。")
+            partial_video_path.unlink(missing_ok=True)
+            task_instance.update_state('PROCESSING', meta={'stage': STAGE_VIDEO_CONCAT, 'status': 'Error: FFmpeg concat failed'})
+            return False
+        if not _publish_final_video(partial_video_path, final_video_path, subtitle_file_path, logger):
+            task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'status': 'Error: Failed to move base video'})
+            return False
 
-        # 将基础无字幕视频移动到最终输出位置
-        # 检查 base_video_path 是否存在 (前面拼接可能失败)
-        if base_video_path.exists():
-            try:
-                 shutil.move(str(base_video_path.resolve()), str(final_video_path.resolve()))
-                 logger.info(f"最终视频 (无字幕) 已保存到: {final_video_path.resolve()}")
-                 if subtitle_file_path.exists(): subtitle_file_path.unlink(missing_ok=True)
-                 task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'progress': 100, 'status': 'Saved video without subtitles'})
-                 return True # 视为成功 (有视频输出)
-            except Exception as e:
-                 logger.error(f"移动最终无字幕视频时出错: {e}", exc_info=True)
-                 task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'status': f'Error: Failed to move base video ({type(e).__name__})'})
-                 return False
+        if srt_is_valid:
+            logger.warning("最终视频 (无字幕 - 因添加失败) 已保存到: %s", final_video_path)
+            status = 'Warning: Subtitles failed, saved video without subtitles'
         else:
-            logger.error("基础视频文件不存在，无法保存无字幕视频。")
-            task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'status': 'Fatal Error: Base video not found'})
-            return False
+            logger.info("最终视频 (无字幕) 已保存到: %s", final_video_path)
+            status = 'Saved video without subtitles'
+        task_instance.update_state('PROCESSING', meta={'stage': STAGE_ADD_SUBTITLES, 'progress': 100, 'status': status})
+        return True # 视为成功 (有视频输出)
+
+        # 理论上代码不会执行到这里
+        logger.error("视频合成函数执行流程异常结束，未返回明确状态。")
+        task_instance.update_state('PROCESSING', meta={'stage': 'Synthesis Logic Error', 'status': 'Error: Unexpected end of function'})
+        return False
+    finally:
+        _wait_background_asr(asr_future, logger)
 
 
-    # 理论上代码不会执行到这里
-    logger.error("视频合成函数执行流程异常结束，未返回明确状态。")
-    task_instance.update_state('PROCESSING', meta={'stage': 'Synthesis Logic Error', 'status': 'Error: Unexpected end of function'})
-    return False
 
+# ... (worker_init 函数保持不变) ...
+WORKER_CONFIG_PATH = Path(__file__).parent.parent / 'config.ini' # worker 信号处理函数读取的配置文件
 
 
-# ... (worker_init 函数保持不变) ...
 @signals.worker_init.connect
 def worker_init(**kwargs):
     logger = logging.getLogger('celery')
     logger.info("Celery worker 正在初始化...")
 
     config = configparser.ConfigParser()
-    config_path = Path(__file__).parent.parent / 'config.ini'
-    if config_path.exists():
+    if WORKER_CONFIG_PATH.exists():
         try:
-            config.read(config_path, encoding='utf-8')
+            config = _load_worker_config() # 在主进程中解析并缓存，prefork 子进程直接继承
             logger.info("Worker 初始化：成功加载配置。")
         except Exception as e:
-            logger.error(f"Worker 初始化：加载配置 {config_path} 失败: {e}", exc_info=True)
+            logger.error(f"Worker 初始化：加载配置 {WORKER_CONFIG_PATH} 失败: {e}", exc_info=True)
 
     logger.info("Worker 初始化：检查外部依赖工具...")
     dependencies_ok = True
     tools_to_check = ["ffmpeg", "ffprobe", "soffice"]
 
-    temp_config_for_check = configparser.ConfigParser()
-    if config_path.exists(): temp_config_for_check.read(config_path, encoding='utf-8')
-
     for tool in tools_to_check:
         try:
-             if get_tool_path(tool, logger, temp_config_for_check) is None:
+             if get_tool_path(tool, logger, config) is None:
                  logger.error(f"Worker 初始化：外部工具 '{tool}' 未找到。依赖于 '{tool}' 的任务可能会失败。")
                  dependencies_ok = False
         except Exception as e:
@@ -803,18 +1692,20 @@ def worker_init(**kwargs):
              dependencies_ok = False
 
     python_libs_check_ok = True
-    libs_to_check = ['core_logic.ppt_processor', 'core_logic.video_synthesizer', 'core_logic.tts_manager_edge', 'core_logic.utils', 'stable_whisper', 'PIL', 'opencc']
-    for lib_name in libs_to_check:
-         try:
-              import importlib
-              importlib.import_module(lib_name)
+    # 只检查当前配置的 ASR 后端所需的库
+    # 可选库在模块顶部已尝试导入并记录了 *_AVAILABLE 标记；项目模块由 tasks.py 在 worker 启动前导入，
+    # 这里只查看结果，不再重复导入 (stable-ts 会连带导入 torch)
+    asr_libs = {'faster': ('faster_whisper', FASTER_WHISPER_AVAILABLE), 'whispercpp': ('pywhispercpp', WHISPERCPP_AVAILABLE)}
+    asr_lib, asr_available = asr_libs.get(config.get('Audio', 'whisper_backend', fallback='openai').strip().lower(), ('stable_whisper', WHISPER_AVAILABLE))
+    project_modules = ['core_logic.ppt_processor', 'core_logic.video_synthesizer', 'core_logic.tts_manager_edge', 'core_logic.utils']
+    libs_to_check = {name: name in sys.modules for name in project_modules}
+    libs_to_check.update({asr_lib: asr_available, 'PIL': PILLOW_AVAILABLE, 'opencc': OPENCC_AVAILABLE})
+    for lib_name, loaded in libs_to_check.items():
+         if loaded:
               logger.info(f"Worker 初始化：Python 模块 '{lib_name}' 导入成功。")
-         except ImportError:
+         else:
               logger.error(f"Worker 初始化：Python 库/模块 '{lib_name}' 未导入。依赖于它的任务将失败。")
               python_libs_check_ok = False
-         except Exception as e:
-              logger.error(f"Worker 初始化：导入 Python 模块 '{lib_name}' 时发生意外错误: {e}", exc_info=True)
-              python_libs_check_ok = False
 
 
     if dependencies_ok and python_libs_check_ok:
@@ -823,6 +1714,63 @@ def worker_init(**kwargs):
         logger.error("Worker 初始化：部分外部依赖或 Python 库检查未通过。请确保所有必需的软件和库已安装。")
 
 
+@functools.lru_cache(maxsize=1)
+def _load_worker_config() -> configparser.ConfigParser:
+    """读取 config.ini 供 worker 信号处理函数使用；进程内只解析一次 (调用方只读不写)。"""
+    config = configparser.ConfigParser()
+    if WORKER_CONFIG_PATH.exists():
+        config.read(WORKER_CONFIG_PATH, encoding='utf-8')
+    return config
+
+
+def _warmup_whisper_model(model, backend: str):
+    """用 1 秒静音做一次识别，提前完成推理后端的首次初始化 (内存分配、线程池等)。"""
+    silence = np.zeros(16000, dtype=np.float32)
+    if backend == 'whispercpp':
+        model.transcribe(silence)
+    elif backend == 'faster':
+        segments, _info = model.transcribe(silence, beam_size=1, vad_filter=False)
+        list(segments) # faster-whisper 的识别是惰性的，需要消费结果
+    else:
+        model.transcribe(silence, fp16=False, verbose=None)
+
+
+@signals.worker_process_init.connect
+def preload_whisper_model(**kwargs):
+    # prefork 子进程启动时预加载 Whisper 模型 ([Audio] whisper_preload)，第一个任务无需等待模型加载
+    config = _load_worker_config()
+    if not config.getboolean('Audio', 'whisper_preload', fallback=False):
+        return
+    logger = logging.getLogger('celery')
+    try:
+        model, backend, _reused = get_whisper_model(config)
+        if NUMPY_AVAILABLE and config.getboolean('Audio', 'whisper_warmup', fallback=True):
+            _warmup_whisper_model(model, backend)
+        logger.info(f"Worker 子进程已预加载 Whisper 模型 (后端: {backend})。")
+    except Exception as e:
+        logger.warning(f"Worker 子进程预加载 Whisper 模型失败: {e}，将在首次识别时加载。")
+
+
+@signals.worker_process_init.connect
+def detect_video_encoder(**kwargs):
+    # 子进程启动时探测一次硬件编码器 (结果由 _detect_hw_encoder 缓存)，避免第一个任务在烧录字幕前等待测试编码
+    config = _load_worker_config()
+    choice = config.get('Video', 'encoder', fallback=config.get('Video', 'hw_encoder', fallback='auto')).strip().lower()
+    if choice != 'auto':
+        return
+    logger = logging.getLogger('celery')
+    ffmpeg_path = get_tool_path("ffmpeg", logger, config)
+    if ffmpeg_path is None:
+        return
+    key = _detect_hw_encoder(ffmpeg_path)
+    logger.info(f"Worker 子进程视频编码器: {HW_ENCODERS[key] if key else 'libx264'}")
+
+
+@signals.worker_process_shutdown.connect
+def release_whisper_model(**kwargs):
+    _load_whisper_model.cache_clear()
+
+
 # --- 获取可用语音列表的函数 ---
 # 这个函数通常由 Web 前端调用，需要从 tasks 模块导入到 app.py
 def get_available_tts_voices(logger: logging.Logger) -> list[dict]:
@@ -0,0 +1,13 @@
+# extensions.py
+# Flask 扩展实例在这里创建 (不绑定 app)，由 app.py 调用 init_app 完成初始化。
+# models.py 只需从这里导入 db，不必先导入整个 app.py (路由、表单、TTS 初始化等)。
+from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
+from flask_login import LoginManager
+
+db = SQLAlchemy()
+migrate = Migrate()
+login_manager = LoginManager()
+login_manager.login_view = 'login'
+login_manager.login_message = '请先登录以访问此页面。'
+login_manager.login_message_category = 'info'
@@ -2,6 +2,7 @@
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, BooleanField, SubmitField, TextAreaField
 from wtforms.validators import DataRequired, Length, Email, EqualTo, ValidationError
+from sqlalchemy import or_
 from models import User # 从 models.py 导入 User 模型，用于验证唯一性
 
 class RegistrationForm(FlaskForm):
@@ -20,16 +21,22 @@ class RegistrationForm(FlaskForm):
                                                  EqualTo('password', message="两次输入的密码不一致。")])
     submit = SubmitField('注册')
 
+    def _existing_accounts(self) -> list[tuple[str, str]]:
+        """用一次查询取出用户名或邮箱与本次输入冲突的账号 (username, email)，两个校验共用结果。"""
+        if getattr(self, '_existing', None) is None:
+            self._existing = User.query.with_entities(User.username, User.email).filter(
+                or_(User.username == self.username.data, User.email == self.email.data)
+            ).all()
+        return self._existing
+
     def validate_username(self, username):
         """验证用户名是否已存在"""
-        user = User.query.filter_by(username=username.data).first()
-        if user:
+        if any(row.username == username.data for row in self._existing_accounts()):
             raise ValidationError('该用户名已被注册，请选择其他用户名。')
 
     def validate_email(self, email):
         """验证邮箱是否已存在"""
-        user = User.query.filter_by(email=email.data).first()
-        if user:
+        if any(row.email == email.data for row in self._existing_accounts()):
             raise ValidationError('该邮箱已被注册，请使用其他邮箱。')
 
 
@@ -2,11 +2,34 @@
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
+from sqlalchemy import inspect as sa_inspect # 启动时检查已有的表 (补建索引)
+
+# 导入 argon2-cffi (可选，C 实现的 Argon2 密码哈希；不可用时使用 Werkzeug 的默认哈希)
+try:
+    from argon2 import PasswordHasher
+    from argon2.exceptions import VerificationError, InvalidHashError
+    _PASSWORD_HASHER = PasswordHasher()
+    ARGON2_AVAILABLE = True
+except ImportError:
+    _PASSWORD_HASHER = None
+    ARGON2_AVAILABLE = False
+
+# db 实例定义在 extensions.py 中 (由 app.py 调用 db.init_app)，导入模型不会触发导入 app.py
+from extensions import db
+
+# 各角色的视频数量上限 (-1 表示不限)，由 app.py 加载配置后调用 load_video_limits() 解析一次
+_VIDEO_LIMITS: dict[str, int] | None = None
+
+
+def load_video_limits(app_config_parser) -> dict[str, int]:
+    """从 [UserRoles] 读取各角色的视频数量上限并缓存。"""
+    global _VIDEO_LIMITS
+    _VIDEO_LIMITS = {
+        'vip': app_config_parser.getint('UserRoles', 'vip_video_limit', fallback=-1),
+        'free': app_config_parser.getint('UserRoles', 'free_video_limit', fallback=1),
+    }
+    return _VIDEO_LIMITS
 
-# db 实例将从 app.py 导入
-# 这要求 app.py 在导入 models.py 之前已经创建了 db = SQLAlchemy(app)
-# 在 app.py 中，确保 'from models import User, TaskRecord' 在 'db = SQLAlchemy(app)' 之后
-from app import db # <--- 确保这能正确工作
 
 class User(UserMixin, db.Model):
     """用户模型"""
@@ -28,18 +51,40 @@ class User(UserMixin, db.Model):
         return f'<User {self.username}>'
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        if ARGON2_AVAILABLE:
+            self.password_hash = _PASSWORD_HASHER.hash(password)
+        else:
+            self.password_hash = generate_password_hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """
+        校验密码。旧的 Werkzeug 哈希 (pbkdf2:/scrypt:) 仍可登录，校验成功后升级为 Argon2；
+        升级后的哈希随登录时的 db.session.commit() 一起保存。
+        """
+        if self.password_hash.startswith('$argon2'):
+            if not ARGON2_AVAILABLE:
+                return False
+            try:
+                _PASSWORD_HASHER.verify(self.password_hash, password)
+            except (VerificationError, InvalidHashError):
+                return False
+            if _PASSWORD_HASHER.check_needs_rehash(self.password_hash):
+                self.set_password(password)
+            return True
+
+        if not check_password_hash(self.password_hash, password):
+            return False
+        if ARGON2_AVAILABLE:
+            self.set_password(password)
+        return True
 
     def can_create_video(self, app_config_parser): 
+        limits = _VIDEO_LIMITS or load_video_limits(app_config_parser)
         if self.role == 'vip':
-            limit = app_config_parser.getint('UserRoles', 'vip_video_limit', fallback=-1)
+            limit = limits['vip']
             return limit == -1 or self.videos_created_count < limit
         else: 
-            limit = app_config_parser.getint('UserRoles', 'free_video_limit', fallback=1)
-            return self.videos_created_count < limit
+            return self.videos_created_count < limits['free']
             
     def increment_video_count(self):
         if self.videos_created_count is None: self.videos_created_count = 0
@@ -63,5 +108,25 @@ class TaskRecord(db.Model):
     completed_at = db.Column(db.DateTime, nullable=True)
     error_message = db.Column(db.Text, nullable=True)
 
+    # 任务列表页按用户筛选并按创建时间倒序排列 (User.tasks.order_by(created_at.desc()))
+    __table_args__ = (
+        db.Index('ix_task_record_user_created', 'user_id', 'created_at'),
+    )
+
     def __repr__(self):
         return f'<TaskRecord {self.id} - Celery: {self.celery_task_id}>'
+
+
+def ensure_task_record_indexes(logger) -> None:
+    """
+    为已存在的 task_record 表补建 __table_args__ 中声明的索引。
+    项目没有迁移脚本，db.create_all() 也不会修改已有的表，旧数据库只能在这里补建。
+    已存在的索引会被跳过 (checkfirst)，可在每次启动时调用；需在应用上下文中执行。
+    """
+    try:
+        if not sa_inspect(db.engine).has_table(TaskRecord.__tablename__):
+            return # 表尚未创建，建表时会一并创建索引
+        for index in TaskRecord.__table__.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+    except Exception as e: # 多个进程同时启动时可能重复创建，失败不影响运行
+        logger.warning(f"补建 TaskRecord 索引失败: {e}")
@@ -0,0 +1,12 @@
+#!/usr/bin/env bash
+# 启动 Celery worker (gevent 进程池)
+# Edge TTS 合成基本是纯网络等待，gevent 可以让一个进程内并发执行多个转换任务，
+# 它们共享 core_logic/tts_manager_edge.py 中的后台事件循环、DNS 缓存与并发信号量。
+# -P gevent 会在导入任务模块之前自动执行 gevent.monkey.patch_all()，无需在代码中手动打补丁。
+# -O fair: 只把任务分配给空闲的执行单元，避免长任务后面排队。
+# 并发数可通过环境变量 CELERY_CONCURRENCY 调整；语音识别等 CPU 密集步骤会占住整个进程，不宜设得过高。
+# 同时进行的 Edge TTS 连接数由 EDGE_TTS_CONCURRENCY 控制 (默认 6)。
+# 需要先安装: pip install gevent
+set -e
+cd "$(dirname "$0")"
+exec celery -A celery_app worker -l info -P gevent --concurrency="${CELERY_CONCURRENCY:-50}" -O fair
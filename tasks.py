@@ -7,6 +7,7 @@ from pathlib import Path
 import shutil
 import time
 import traceback
+import concurrent.futures
 from datetime import datetime
 
 # --- 从 celery_app 模块导入 Celery 应用实例 ---
@@ -36,6 +37,7 @@ try:
     from core_logic.ppt_processor import process_presentation_for_task
     from core_logic.video_synthesizer import synthesize_video_for_task
     from core_logic.tts_manager_edge import get_available_voices as get_available_tts_voices_core
+    from core_logic.utils import run_blocking_io, ThrottledTaskState
     CORE_LOGIC_LOADED = True
 except ImportError as e:
     logging.error(f"FATAL ERROR: tasks.py 无法导入核心逻辑模块: {e}", exc_info=True)
@@ -51,6 +53,20 @@ STAGE_COMPLETE = 'Complete'
 STAGE_DB_UPDATE = 'Updating Database'
 
 
+# --- 后台清理 ---
+# 临时目录中包含全部视频片段和中间文件，删除可能耗时较长；交给后台线程执行，任务结束后 worker 可以立即接收下一个任务。
+_cleanup_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="task-cleanup")
+
+
+def _remove_temp_dir(temp_run_dir: Path, task_celery_id: str, logger: logging.Logger):
+    """在后台线程中删除任务临时目录。"""
+    try:
+        run_blocking_io(shutil.rmtree, temp_run_dir) # gevent 下执行器线程是 greenlet，删除操作交给系统线程
+        logger.info(f"任务 {task_celery_id}: 临时目录已清理。")
+    except Exception as clean_e:
+        logger.error(f"任务 {task_celery_id}: 清理临时目录 {temp_run_dir} 失败: {clean_e}", exc_info=True)
+
+
 # 使用从 celery_app.py 导入的 celery_app 实例来装饰任务
 @celery_app.task(bind=True, name='ppt_to_video.convert_task', acks_late=True, reject_on_worker_lost=True,
                   time_limit=3600, soft_time_limit=3500)
@@ -106,6 +122,7 @@ def convert_ppt_to_video_task(self, pptx_filepath_str: str, output_dir_str: str,
     temp_run_dir = None
     final_video_relative_path = None
     task_record = None
+    progress_state = None
 
     try:
         task_record = _db_instance_task.session.get(_TaskRecord_model_task, task_record_id)
@@ -139,22 +156,26 @@ def convert_ppt_to_video_task(self, pptx_filepath_str: str, output_dir_str: str,
         _db_instance_task.session.commit()
 
         self.update_state(state='PROCESSING', meta={'stage': STAGE_PPT_PROCESSING, 'progress': 10})
+        # core_logic 内部的细粒度进度经节流后再写入结果后端
+        progress_state = ThrottledTaskState(self, current_task_config.getfloat('General', 'progress_update_interval', fallback=0.5))
         processed_data, temp_run_dir = process_presentation_for_task(
-            pptx_filepath, base_temp_dir, voice_id, logger, current_task_config, self
+            pptx_filepath, base_temp_dir, voice_id, logger, current_task_config, progress_state
         )
+        progress_state.flush() # 先发出被节流的最后进度，再直接写入下一阶段的状态
         self.update_state(state='PROCESSING', meta={'stage': STAGE_PPT_PROCESSING, 'progress': 45})
 
         self.update_state(state='PROCESSING', meta={'stage': STAGE_VIDEO_SYNTHESIS, 'progress': 50})
         synthesis_success = synthesize_video_for_task(
-            processed_data, temp_run_dir, final_video_full_path, logger, current_task_config, self
+            processed_data, temp_run_dir, final_video_full_path, logger, current_task_config, progress_state
         )
+        progress_state.flush()
 
         if not synthesis_success:
             raise RuntimeError("视频合成步骤返回失败。")
 
         end_time = time.time()
         duration = end_time - start_time
-        logger.info(f"任务 {task_celery_id} 成功！输出: {final_video_full_path.resolve()}，耗时: {duration:.2f}s")
+        logger.info(f"任务 {task_celery_id} 成功！输出: {final_video_full_path}，耗时: {duration:.2f}s")
         self.update_state(state='PROCESSING', meta={'stage': STAGE_DB_UPDATE, 'progress': 95, 'status': '更新数据库记录...'})
         
         task_record.status = 'SUCCESS'
@@ -184,6 +205,8 @@ def convert_ppt_to_video_task(self, pptx_filepath_str: str, output_dir_str: str,
         error_msg_for_db = f"{type(e).__name__}: {str(e)}\n\nTraceback:\n{detailed_traceback}"
         logger.error(f"任务 {task_celery_id} (DB Record: {task_record_id if task_record else 'N/A'}) 失败: {e}", exc_info=True)
 
+        if progress_state is not None:
+            progress_state.flush() # 避免定时补发的进度覆盖下面的 FAILURE 状态
         current_meta_for_celery = {}
         try:
             current_meta_for_celery = self.request.get_current_task().info or {}
@@ -212,12 +235,11 @@ def convert_ppt_to_video_task(self, pptx_filepath_str: str, output_dir_str: str,
             cleanup_temp = _config_parser_task.getboolean('General', 'cleanup_temp_dir', fallback=True)
             if temp_run_dir and temp_run_dir.exists():
                 if cleanup_temp:
-                    logger.info(f"任务 {task_celery_id}: 清理临时目录: {temp_run_dir}")
+                    logger.info(f"任务 {task_celery_id}: 清理临时目录 (后台): {temp_run_dir}")
                     try:
-                        shutil.rmtree(temp_run_dir)
-                        logger.info(f"任务 {task_celery_id}: 临时目录已清理。")
-                    except Exception as clean_e:
-                        logger.error(f"任务 {task_celery_id}: 清理临时目录 {temp_run_dir} 失败: {clean_e}", exc_info=True)
+                        _cleanup_executor.submit(_remove_temp_dir, temp_run_dir, task_celery_id, logger)
+                    except RuntimeError: # 执行器已关闭 (进程正在退出)，同步清理
+                        _remove_temp_dir(temp_run_dir, task_celery_id, logger)
                 else:
                     logger.info(f"任务 {task_celery_id}: 临时文件保留于: {temp_run_dir} (cleanup_temp_dir=False)")
             elif temp_run_dir:
@@ -239,3 +261,9 @@ def worker_init_handler(**kwargs):
         worker_logger.critical("核心逻辑模块在 worker 初始化时未加载。")
     worker_logger.info("Worker 初始化完成。")
 
+
+@signals.worker_process_shutdown.connect
+def worker_process_shutdown_handler(**kwargs):
+    # 子进程退出前 (例如达到 worker_max_tasks_per_child) 等待尚未完成的临时目录清理
+    _cleanup_executor.shutdown(wait=True)
+